@@ -5,6 +5,7 @@ from datetime import datetime
 from dataclasses import dataclass
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit, Layout
+from requests.exceptions import HTTPError
 import json
 from abc import ABC, abstractmethod
 
@@ -184,6 +185,26 @@ class GenericBroker(ABC):
         """
         pass
 
+    def process_reduced_data_bulk(self, targets):
+        """
+        Retrieves and creates records for any reduced data provided by a specific broker for each of several targets.
+        By default this calls ``process_reduced_data`` for each target in turn; brokers that can retrieve data for
+        several targets more efficiently may override it.
+
+        :param targets: ``Target`` objects that were previously created from ``BrokerQuery`` alerts
+        :type targets: iterable of Target
+
+        :returns: Targets for which the broker could not be reached
+        :rtype: list of Target
+        """
+        failed_targets = []
+        for target in targets:
+            try:
+                self.process_reduced_data(target)
+            except HTTPError:
+                failed_targets.append(target)
+        return failed_targets
+
     def to_target(self, alert):
         """
         Creates ``Target`` object from the broker-specific alert data.
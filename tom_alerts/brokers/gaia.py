@@ -2,15 +2,72 @@ from tom_alerts.alerts import GenericQueryForm, GenericAlert, GenericBroker
 from tom_dataproducts.models import ReducedDatum
 from dateutil.parser import parse
 from django import forms
-from astropy.coordinates import SkyCoord
+from django.core.cache import cache
 from astropy.time import Time, TimezoneInfo
-import astropy.units as u
+import numpy as np
 import requests
 from requests.exceptions import HTTPError
 import json
-from os import path
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson as json_decoder
+except ImportError:
+    json_decoder = json
 
 BROKER_URL = 'http://gsaweb.ast.cam.ac.uk/alerts/alertsindex'
+ALERTS_CACHE_TIMEOUT = 300
+ALERTS_PATTERN = re.compile(r'var\s+alerts\s*=\s*(\[.*?\]);', re.DOTALL)
+
+
+def _cone_mask(ras, decs, ra0, dec0, radius_deg):
+    """
+    Returns a boolean array indicating which of the given coordinates lie within radius_deg of (ra0, dec0). All values
+    are in degrees. The test compares the cosine of the great-circle distance with the cosine of the radius, which
+    avoids computing the separations themselves.
+    """
+    ras = np.radians(ras)
+    decs = np.radians(decs)
+    ra0 = np.radians(ra0)
+    dec0 = np.radians(dec0)
+    cos_angle = np.sin(decs) * np.sin(dec0) + np.cos(decs) * np.cos(dec0) * np.cos(ras - ra0)
+    return cos_angle >= np.cos(np.radians(radius_deg))
+
+
+def _load_alerts_index():
+    """
+    Returns the list of alerts embedded in the Gaia alerts index page, along with a dict of the same alerts keyed by
+    name. Both fetch_alert and process_reduced_data go through the index, so it is cached briefly rather than
+    re-downloaded for every target.
+    """
+    alerts_index = cache.get('gaia_alerts')
+
+    if alerts_index is None:
+        response = requests.get(BROKER_URL)
+        response.raise_for_status()
+
+        alerts_match = ALERTS_PATTERN.search(response.text)
+        if not alerts_match:
+            raise Exception('Unable to find alerts in the broker response')
+
+        alert_list = json_decoder.loads(alerts_match.group(1))
+        alerts_index = (alert_list, {alert['name']: alert for alert in alert_list})
+        cache.set('gaia_alerts', alerts_index, ALERTS_CACHE_TIMEOUT)
+
+    return alerts_index
+
+
+def _find_alert(target_name, alert_list, alerts_by_name):
+    """
+    Returns the alert named ``target_name``, or else the only alert whose name contains ``target_name``, or an empty
+    dict if there is no such alert.
+    """
+    if target_name in alerts_by_name:
+        return alerts_by_name[target_name]
+
+    matching_alerts = [alert for alert in alert_list if target_name in alert['name']]
+    return matching_alerts[0] if len(matching_alerts) == 1 else {}
 
 
 class GaiaQueryForm(GenericQueryForm):
@@ -35,25 +92,13 @@ class GaiaBroker(GenericBroker):
 
     def fetch_alerts(self, parameters):
         """Must return an iterator"""
-        response = requests.get(BROKER_URL)
-        response.raise_for_status()
-
-        html_data = response.text.split('\n')
-        for line in html_data:
-            if 'var alerts' in line:
-                alerts_data = line.replace('var alerts = ', '')
-                alerts_data = alerts_data.replace('\n', '').replace(';', '')
-
-        alert_list = json.loads(alerts_data)
+        alert_list, _ = _load_alerts_index()
 
         if parameters['cone'] is not None and len(parameters['cone']) > 0:
             cone_params = parameters['cone'].split(',')
             parameters['cone_ra'] = float(cone_params[0])
             parameters['cone_dec'] = float(cone_params[1])
-            parameters['cone_radius'] = float(cone_params[2])*u.deg
-            parameters['cone_centre'] = SkyCoord(float(cone_params[0]),
-                                                 float(cone_params[1]),
-                                                 frame="icrs", unit="deg")
+            parameters['cone_radius'] = float(cone_params[2])
 
         filtered_alerts = []
         if parameters['target_name'] is not None and \
@@ -63,11 +108,10 @@ class GaiaBroker(GenericBroker):
                     filtered_alerts.append(alert)
 
         elif 'cone_radius' in parameters.keys():
-            for alert in alert_list:
-                c = SkyCoord(float(alert['ra']), float(alert['dec']),
-                             frame="icrs", unit="deg")
-                if parameters['cone_centre'].separation(c) <= parameters['cone_radius']:
-                    filtered_alerts.append(alert)
+            ras = np.fromiter((float(alert['ra']) for alert in alert_list), dtype=np.float64, count=len(alert_list))
+            decs = np.fromiter((float(alert['dec']) for alert in alert_list), dtype=np.float64, count=len(alert_list))
+            mask = _cone_mask(ras, decs, parameters['cone_ra'], parameters['cone_dec'], parameters['cone_radius'])
+            filtered_alerts = [alert for alert, in_cone in zip(alert_list, mask.tolist()) if in_cone]
 
         else:
             filtered_alerts = alert_list
@@ -75,13 +119,7 @@ class GaiaBroker(GenericBroker):
         return iter(filtered_alerts)
 
     def fetch_alert(self, target_name):
-
-        alert_list = list(self.fetch_alerts({'target_name': target_name, 'cone': None}))
-
-        if len(alert_list) == 1:
-            return alert_list[0]
-        else:
-            return {}
+        return _find_alert(target_name, *_load_alerts_index())
 
     def to_generic_alert(self, alert):
         timestamp = parse(alert['obstime'])
@@ -113,36 +151,100 @@ class GaiaBroker(GenericBroker):
                                        alert['per_alert']['link'])
 
         if alert:
-            lc_url = path.join(base_url, alert['name'], 'lightcurve.csv')
+            lc_url = f'{base_url}/{alert["name"]}/lightcurve.csv'
         elif target:
-            lc_url = path.join(base_url, target.name, 'lightcurve.csv')
+            lc_url = f'{base_url}/{target.name}/lightcurve.csv'
         else:
             return
 
-        response = requests.get(lc_url)
-        response.raise_for_status()
-        html_data = response.text.split('\n')
-
-        for entry in html_data[2:]:
-            phot_data = entry.split(',')
-
-            if len(phot_data) == 3:
-                if 'untrusted' not in phot_data[2] and 'null' not in phot_data[2]:
-                    jd = Time(float(phot_data[1]), format='jd', scale='utc')
-                    jd.to_datetime(timezone=TimezoneInfo())
-
-                    value = {
-                        'magnitude': float(phot_data[2]),
-                        'filter': 'G'
-                    }
-
-                    rd, created = ReducedDatum.objects.get_or_create(
-                        timestamp=jd.to_datetime(timezone=TimezoneInfo()),
-                        value=json.dumps(value),
-                        source_name=self.name,
-                        source_location=alert_url,
-                        data_type='photometry',
-                        target=target)
-                    rd.save()
+        photometry = self._fetch_lightcurve(lc_url)
+        self._save_lightcurve(target, alert_url, photometry)
 
         return
+
+    def process_reduced_data_bulk(self, targets, max_workers=8):
+        """
+        Retrieves the Gaia lightcurves of several targets concurrently, as the time taken is dominated by the latency
+        of each download. The photometry is stored from the calling thread once each download completes. Targets that
+        have no Gaia alert are skipped.
+
+        :param targets: ``Target`` objects that were previously created from Gaia alerts
+        :type targets: iterable of Target
+
+        :param max_workers: Maximum number of lightcurves to download at once
+        :type max_workers: int
+
+        :returns: Targets whose lightcurves could not be retrieved
+        :rtype: list of Target
+        """
+        base_url = BROKER_URL.replace('/alertsindex', '/alert')
+
+        # Read the alerts index from the cache once, rather than once per target
+        try:
+            alert_list, alerts_by_name = _load_alerts_index()
+        except HTTPError:
+            return list(targets)
+        target_alerts = [(target, _find_alert(target.name, alert_list, alerts_by_name)) for target in targets]
+
+        failed_targets = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            downloads = [
+                (target, alert, executor.submit(self._fetch_lightcurve, f'{base_url}/{alert["name"]}/lightcurve.csv'))
+                for target, alert in target_alerts if alert
+            ]
+            for target, alert, download in downloads:
+                try:
+                    photometry = download.result()
+                except HTTPError:
+                    failed_targets.append(target)
+                    continue
+                alert_url = BROKER_URL.replace('/alerts/alertsindex', alert['per_alert']['link'])
+                self._save_lightcurve(target, alert_url, photometry)
+
+        return failed_targets
+
+    def _fetch_lightcurve(self, lc_url):
+        """
+        Downloads and parses a Gaia lightcurve, returning an array of (JD, magnitude) rows with the untrusted points
+        removed. This does not touch the database, so it is safe to call from a worker thread.
+        """
+        # The first two lines of the lightcurve are the alert name and the column headings. Magnitudes flagged as
+        # 'untrusted' or 'null' fail the float conversion and are read in as NaN, so they can be masked out together.
+        with requests.get(lc_url, stream=True) as response:
+            response.raise_for_status()
+            photometry = np.genfromtxt(response.iter_lines(decode_unicode=True), delimiter=',', usecols=(1, 2),
+                                       skip_header=2, dtype=np.float64, invalid_raise=False).reshape(-1, 2)
+        return photometry[np.isfinite(photometry).all(axis=1)]
+
+    def _save_lightcurve(self, target, alert_url, photometry):
+        if len(photometry) == 0:
+            return
+
+        timestamps = Time(photometry[:, 0], format='jd', scale='utc').to_datetime(timezone=TimezoneInfo())
+
+        # Fetch the points already ingested from this alert in one query, rather than a get_or_create per point
+        existing_data = set(ReducedDatum.objects.filter(
+            target=target,
+            source_name=self.name,
+            source_location=alert_url,
+            data_type='photometry'
+        ).values_list('timestamp', 'value'))
+
+        new_data = []
+        for timestamp, magnitude in zip(timestamps, photometry[:, 1].tolist()):
+            value = json.dumps({
+                'magnitude': magnitude,
+                'filter': 'G'
+            })
+            if (timestamp, value) in existing_data:
+                continue
+            existing_data.add((timestamp, value))
+            new_data.append(ReducedDatum(
+                timestamp=timestamp,
+                value=value,
+                source_name=self.name,
+                source_location=alert_url,
+                data_type='photometry',
+                target=target))
+
+        ReducedDatum.objects.bulk_create(new_data, batch_size=500)
@@ -0,0 +1,131 @@
+import json
+from io import BytesIO
+from requests import Response
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from unittest import mock
+
+from tom_alerts.brokers import gaia
+from tom_alerts.brokers.gaia import GaiaBroker
+from tom_targets.models import Target
+from tom_dataproducts.models import ReducedDatum
+
+alerts = [
+    {
+        'name': 'Gaia19aaa',
+        'ra': '10.0',
+        'dec': '10.0',
+        'alertMag': '15.2',
+        'obstime': '2019-01-01 12:00:00',
+        'per_alert': {'link': '/alerts/alert/Gaia19aaa/'}
+    },
+    {
+        'name': 'Gaia19aab',
+        'ra': '10.5',
+        'dec': '10.0',
+        'alertMag': '16.7',
+        'obstime': '2019-01-02 12:00:00',
+        'per_alert': {'link': '/alerts/alert/Gaia19aab/'}
+    },
+    {
+        'name': 'Gaia19aac',
+        'ra': '200.0',
+        'dec': '-30.0',
+        'alertMag': '17.1',
+        'obstime': '2019-01-03 12:00:00',
+        'per_alert': {'link': '/alerts/alert/Gaia19aac/'}
+    }
+]
+
+lightcurve = '\n'.join([
+    'Gaia19aaa',
+    '#Date,JD(TCB),averagemag.',
+    '2014-08-01 10:22:31,2456870.93,19.33',
+    '2014-08-02 10:22:31,2456871.93,untrusted',
+    '2014-08-03 10:22:31,2456872.93,null',
+    '2014-08-04 10:22:31,2456873.93,18.50',
+    ''
+])
+
+
+def make_response(content):
+    response = Response()
+    response.raw = BytesIO(str.encode(content))
+    response.status_code = 200
+    return response
+
+
+@override_settings(TOM_ALERT_CLASSES=['tom_alerts.brokers.gaia.GaiaBroker'],
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestGaiaBrokerClass(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_target = Target.objects.create(name='Gaia19aaa')
+        self.alerts_index = '<html>\n<script>\nvar alerts = {};\n</script>\n</html>'.format(json.dumps(alerts))
+
+    @mock.patch('tom_alerts.brokers.gaia.requests.get')
+    def test_fetch_alerts_target_name(self, mock_requests_get):
+        mock_requests_get.return_value = make_response(self.alerts_index)
+
+        fetched_alerts = list(GaiaBroker().fetch_alerts({'target_name': 'Gaia19aac', 'cone': None}))
+        self.assertEqual(['Gaia19aac'], [alert['name'] for alert in fetched_alerts])
+
+    @mock.patch('tom_alerts.brokers.gaia.requests.get')
+    def test_fetch_alerts_cone(self, mock_requests_get):
+        mock_requests_get.return_value = make_response(self.alerts_index)
+
+        fetched_alerts = list(GaiaBroker().fetch_alerts({'target_name': '', 'cone': '10,10,1'}))
+        self.assertEqual(['Gaia19aaa', 'Gaia19aab'], [alert['name'] for alert in fetched_alerts])
+
+        fetched_alerts = list(GaiaBroker().fetch_alerts({'target_name': '', 'cone': '10,10,0.1'}))
+        self.assertEqual(['Gaia19aaa'], [alert['name'] for alert in fetched_alerts])
+
+    @mock.patch('tom_alerts.brokers.gaia.requests.get')
+    def test_fetch_alerts_cached(self, mock_requests_get):
+        mock_requests_get.return_value = make_response(self.alerts_index)
+
+        GaiaBroker().fetch_alerts({'target_name': 'Gaia19aaa', 'cone': None})
+        fetched_alerts = list(GaiaBroker().fetch_alerts({'target_name': 'Gaia19aab', 'cone': None}))
+        self.assertEqual(['Gaia19aab'], [alert['name'] for alert in fetched_alerts])
+        self.assertEqual(mock_requests_get.call_count, 1)
+
+    @mock.patch('tom_alerts.brokers.gaia.requests.get')
+    def test_fetch_alert(self, mock_requests_get):
+        mock_requests_get.return_value = make_response(self.alerts_index)
+
+        self.assertEqual(GaiaBroker().fetch_alert('Gaia19aab')['name'], 'Gaia19aab')
+        self.assertEqual(GaiaBroker().fetch_alert('Gaia19aac')['name'], 'Gaia19aac')
+        self.assertEqual(GaiaBroker().fetch_alert('19aac')['name'], 'Gaia19aac')
+        self.assertEqual(GaiaBroker().fetch_alert('Gaia19'), {})
+
+    @mock.patch('tom_alerts.brokers.gaia.requests.get')
+    def test_process_reduced_data(self, mock_requests_get):
+        mock_requests_get.side_effect = lambda *args, **kwargs: make_response(lightcurve)
+
+        GaiaBroker().process_reduced_data(self.test_target, alert=alerts[0])
+        mock_requests_get.assert_called_with('http://gsaweb.ast.cam.ac.uk/alerts/alert/Gaia19aaa/lightcurve.csv',
+                                             stream=True)
+        reduced_data = ReducedDatum.objects.filter(target=self.test_target, source_name='Gaia')
+        self.assertEqual(reduced_data.count(), 2)
+        self.assertEqual(json.loads(reduced_data.latest().value), {'magnitude': 18.5, 'filter': 'G'})
+
+        # Processing the same lightcurve again should not duplicate any points
+        GaiaBroker().process_reduced_data(self.test_target, alert=alerts[0])
+        self.assertEqual(reduced_data.count(), 2)
+
+    @mock.patch('tom_alerts.brokers.gaia.requests.get')
+    def test_process_reduced_data_bulk(self, mock_requests_get):
+        def mock_get(url, **kwargs):
+            return make_response(self.alerts_index if url.endswith('alertsindex') else lightcurve)
+        mock_requests_get.side_effect = mock_get
+        other_target = Target.objects.create(name='Gaia19aab')
+        missing_target = Target.objects.create(name='not_a_gaia_target')
+
+        with mock.patch('tom_alerts.brokers.gaia._load_alerts_index', wraps=gaia._load_alerts_index) as mock_load:
+            failed_targets = GaiaBroker().process_reduced_data_bulk([self.test_target, other_target, missing_target])
+        self.assertEqual(mock_load.call_count, 1)
+        self.assertEqual(failed_targets, [])
+        for target in [self.test_target, other_target]:
+            self.assertEqual(ReducedDatum.objects.filter(target=target, source_name='Gaia').count(), 2)
+        self.assertFalse(ReducedDatum.objects.filter(target=missing_target).exists())
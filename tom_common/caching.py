@@ -0,0 +1,19 @@
+from django.core.signals import setting_changed
+
+
+def clear_on_setting_changed(*setting_names):
+    """
+    Decorator for an ``lru_cache``-wrapped function that clears its cache whenever one of the given settings is
+    changed, for example by ``override_settings`` in tests.
+
+    :param setting_names: Names of the settings the cached function depends on
+    :type setting_names: str
+    """
+    def decorator(cached_function):
+        def clear_cache(setting, **kwargs):
+            if setting in setting_names:
+                cached_function.cache_clear()
+
+        setting_changed.connect(clear_cache, weak=False)
+        return cached_function
+    return decorator
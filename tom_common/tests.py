@@ -1,8 +1,12 @@
+from functools import lru_cache
+
 from django.test import TestCase, override_settings
 
 from django.contrib.auth.models import User
 from django.urls import reverse
 
+from tom_common.caching import clear_on_setting_changed
+
 
 class TestUserManagement(TestCase):
     def setUp(self):
@@ -99,3 +103,23 @@ class TestAuthScheme(TestCase):
         response = self.client.get(reverse('tom_targets:list'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Create Targets')
+
+
+class TestClearOnSettingChanged(TestCase):
+    def test_clear_on_setting_changed(self):
+        calls = []
+
+        @clear_on_setting_changed('EXTRA_FIELDS', 'HINTS_ENABLED')
+        @lru_cache(maxsize=1)
+        def cached():
+            calls.append(1)
+
+        cached()
+        cached()
+        self.assertEqual(len(calls), 1)
+        with override_settings(OPEN_URLS=[]):
+            cached()
+        self.assertEqual(len(calls), 1)
+        with override_settings(HINTS_ENABLED=True):
+            cached()
+        self.assertEqual(len(calls), 2)
@@ -1,13 +1,62 @@
 import mimetypes
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
+from django.contrib.auth.models import Group
+from django.db import connection
+from functools import lru_cache
+from guardian.shortcuts import assign_perm
 from importlib import import_module
 
-from tom_dataproducts.models import ReducedDatum
+from tom_common.hooks import run_hook
+from tom_dataproducts.models import DataProduct, ReducedDatum
 
 
 DEFAULT_DATA_PROCESSOR_CLASS = 'tom_dataproducts.data_processor.DataProcessor'
 
+mimetypes.add_type('image/fits', '.fits')
+mimetypes.add_type('image/fits', '.fz')
+mimetypes.add_type('application/fits', '.fits')
+mimetypes.add_type('application/fits', '.fz')
+
+
+@lru_cache(maxsize=None)
+def _get_processor_class(processor_class):
+    """
+    Imports and returns the class at the dotted path ``processor_class``. Resolved classes are cached by path, so a
+    change to ``DATA_PROCESSORS`` simply resolves the new path.
+    """
+    try:
+        mod_name, class_name = processor_class.rsplit('.', 1)
+        mod = import_module(mod_name)
+        return getattr(mod, class_name)
+    except (ImportError, AttributeError):
+        raise ImportError('Could not import {}. Did you provide the correct path?'.format(processor_class))
+
+
+def _process_data(dp):
+    """
+    Runs the ``DataProcessor`` specified in ``settings.DATA_PROCESSORS`` for the `data_product_type` of dp, and returns
+    the processed data without saving it.
+    """
+    try:
+        processor_class = settings.DATA_PROCESSORS[dp.data_product_type]
+    except Exception:
+        processor_class = DEFAULT_DATA_PROCESSOR_CLASS
+
+    clazz = _get_processor_class(processor_class)
+    data_processor = clazz()
+    return data_processor.process_data(dp)
+
+
+def _save_reduced_data(dp, data):
+    reduced_datums = [ReducedDatum(target=dp.target, data_product=dp, data_type=dp.data_product_type,
+                                   timestamp=datum[0], value=datum[1]) for datum in data]
+    ReducedDatum.objects.bulk_create(reduced_datums, batch_size=1000)
+
+    return ReducedDatum.objects.filter(data_product=dp)
+
 
 def run_data_processor(dp):
     """
@@ -20,27 +69,92 @@ def run_data_processor(dp):
     :returns: QuerySet of `ReducedDatum` objects created by the `run_data_processor` call
     :rtype: `QuerySet` of `ReducedDatum`
     """
+    return _save_reduced_data(dp, _process_data(dp))
 
-    try:
-        processor_class = settings.DATA_PROCESSORS[dp.data_product_type]
-    except Exception:
-        processor_class = DEFAULT_DATA_PROCESSOR_CLASS
 
+def _process_data_in_thread(dp):
+    """
+    Runs ``_process_data`` in a worker thread, closing any database connection the processor opened in that thread.
+    """
     try:
-        mod_name, class_name = processor_class.rsplit('.', 1)
-        mod = import_module(mod_name)
-        clazz = getattr(mod, class_name)
-    except (ImportError, AttributeError):
-        raise ImportError('Could not import {}. Did you provide the correct path?'.format(processor_class))
+        return _process_data(dp)
+    finally:
+        connection.close()
 
-    data_processor = clazz()
-    data = data_processor.process_data(dp)
 
-    reduced_datums = [ReducedDatum(target=dp.target, data_product=dp, data_type=dp.data_product_type,
-                                   timestamp=datum[0], value=datum[1]) for datum in data]
-    ReducedDatum.objects.bulk_create(reduced_datums)
+def run_data_processors(data_products, max_workers=None):
+    """
+    Runs the data processor for each of the given data products, and inserts the returned values into the database in
+    the order the data products were given. By default the files are processed one after another. If ``max_workers``,
+    or ``settings.DATA_PROCESSING_WORKERS`` when it is not given, is greater than 1, up to that many files are read and
+    processed at once in worker threads, while the inserts are still made from the calling thread. No more than twice
+    ``max_workers`` files are then processed ahead of the inserts.
 
-    return ReducedDatum.objects.filter(data_product=dp)
+    :param data_products: DataProducts which will be processed
+    :type data_products: list of DataProduct
+
+    :param max_workers: Number of files to process at once
+    :type max_workers: int
+
+    :returns: Generator of 3-tuples, each with a DataProduct, a QuerySet of the `ReducedDatum` objects created for it
+              and the exception raised while processing it. Either of the last two will be None.
+    :rtype: generator
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'DATA_PROCESSING_WORKERS', 1)
+
+    def save(dp, process):
+        try:
+            return dp, _save_reduced_data(dp, process()), None
+        except Exception as e:
+            return dp, None, e
+
+    if max_workers <= 1:
+        for dp in data_products:
+            yield save(dp, lambda: _process_data(dp))
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for dp in data_products:
+            pending.append((dp, executor.submit(_process_data_in_thread, dp).result))
+            if len(pending) > 2 * max_workers:
+                yield save(*pending.popleft())
+        while pending:
+            yield save(*pending.popleft())
+
+
+def process_data_product(data_product_id, group_ids=None):
+    """
+    Runs the ``data_product_post_upload`` hook and the data processor for an uploaded ``DataProduct``, and gives the
+    specified groups access to it. If processing fails, the ``DataProduct`` and any ``ReducedDatum`` objects it
+    produced are deleted and the exception is re-raised.
+
+    Only primary keys are accepted so that this can be run as a background task. See ``DATA_PROCESSING_DISPATCHER``.
+
+    :param data_product_id: Primary key of the DataProduct to process
+    :type data_product_id: int
+
+    :param group_ids: Primary keys of the groups that should be able to view the DataProduct
+    :type group_ids: list of int
+
+    :returns: QuerySet of `ReducedDatum` objects created by the `run_data_processor` call
+    :rtype: `QuerySet` of `ReducedDatum`
+    """
+    dp = DataProduct.objects.get(pk=data_product_id)
+    try:
+        run_hook('data_product_post_upload', dp)
+        reduced_data = run_data_processor(dp)
+        if not settings.TARGET_PERMISSIONS_ONLY:
+            for group in Group.objects.filter(pk__in=group_ids or []):
+                assign_perm('tom_dataproducts.view_dataproduct', group, dp)
+                assign_perm('tom_dataproducts.delete_dataproduct', group, dp)
+                assign_perm('tom_dataproducts.view_reduceddatum', group, reduced_data)
+    except Exception:
+        ReducedDatum.objects.filter(data_product=dp).delete()
+        dp.delete()
+        raise
+    return reduced_data
 
 
 class DataProcessor():
@@ -48,11 +162,6 @@ class DataProcessor():
     FITS_MIMETYPES = ['image/fits', 'application/fits']
     PLAINTEXT_MIMETYPES = ['text/plain', 'text/csv']
 
-    mimetypes.add_type('image/fits', '.fits')
-    mimetypes.add_type('image/fits', '.fz')
-    mimetypes.add_type('application/fits', '.fits')
-    mimetypes.add_type('application/fits', '.fz')
-
     def process_data(self, data_product):
         """
         Routes a photometry processing call to a method specific to a file-format. This method is expected to be
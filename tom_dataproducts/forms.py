@@ -6,6 +6,8 @@ from tom_dataproducts.models import DataProductGroup, DataProduct
 from tom_observations.models import ObservationRecord
 from tom_targets.models import Target
 
+DATA_PRODUCT_TYPE_CHOICES = tuple(settings.DATA_PRODUCT_TYPES.values())
+
 
 class AddProductToGroupForm(forms.Form):
     products = forms.ModelMultipleChoiceField(
@@ -32,7 +34,7 @@ class DataProductUploadForm(forms.Form):
         )
     )
     data_product_type = forms.ChoiceField(
-        choices=[v for k, v in settings.DATA_PRODUCT_TYPES.items()],
+        choices=DATA_PRODUCT_TYPE_CHOICES,
         widget=forms.RadioSelect(),
         required=True
     )
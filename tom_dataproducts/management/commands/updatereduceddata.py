@@ -1,4 +1,3 @@
-from requests.exceptions import HTTPError
 from django.core.management.base import BaseCommand
 from django.core.exceptions import ObjectDoesNotExist
 
@@ -35,12 +34,9 @@ class Command(BaseCommand):
                 ).values_list('target').distinct())
 
         failed_records = {}
-        for target in targets:
-            for class_name, clazz in broker_classes.items():
-                try:
-                    clazz.process_reduced_data(target)
-                except HTTPError:
-                    failed_records[class_name] = target.id
+        for class_name, clazz in broker_classes.items():
+            for target in clazz.process_reduced_data_bulk(targets):
+                failed_records[class_name] = target.id
 
         if len(failed_records) == 0:
             return 'Update completed successfully'
@@ -2,19 +2,31 @@ import mimetypes
 import numpy as np
 
 from datetime import datetime
+from functools import lru_cache
 
 from astropy import units
-from astropy.io import fits, ascii
+from astropy.io import fits
 from astropy.time import Time
 from astropy.wcs import WCS
 from specutils import Spectrum1D
 
+from tom_common.caching import clear_on_setting_changed
 from tom_dataproducts.data_processor import DataProcessor
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from tom_observations.facility import get_service_class, get_service_classes
 
 
+@clear_on_setting_changed('TOM_FACILITY_CLASSES')
+@lru_cache(maxsize=1)
+def _get_facility_instances():
+    """
+    Returns an instance of each configured facility class. Facilities hold no per-spectrum state, so the instances are
+    reused for every uploaded file rather than constructing each facility to test its FITS header keywords.
+    """
+    return [clazz() for clazz in get_service_classes().values()]
+
+
 class SpectroscopyProcessor(DataProcessor):
 
     DEFAULT_WAVELENGTH_UNITS = units.angstrom
@@ -62,41 +74,89 @@ class SpectroscopyProcessor(DataProcessor):
         :rtype: AstroPy.Time
         """
 
-        flux, header = fits.getdata(data_product.data.path, header=True)
+        with fits.open(data_product.data.path, memmap=True) as hdul:
+            # As with fits.getdata, the spectrum is read from the first extension if the primary HDU is empty
+            hdu = hdul[0] if hdul[0].header.get('NAXIS', 0) > 0 else hdul[1]
+            header = hdu.header
 
-        for facility_class in get_service_classes():
-            facility = get_service_class(facility_class)()
-            if facility.is_fits_facility(header):
+            facility = next(
+                (facility for facility in _get_facility_instances() if facility.is_fits_facility(header)), None
+            )
+            if facility:
                 flux_constant = facility.get_flux_constant()
                 date_obs = facility.get_date_obs(header)
-                break
+            else:
+                flux_constant = self.DEFAULT_FLUX_CONSTANT
+                date_obs = datetime.now()
+
+            # Only the first spectrum of a multi-dimensional file is used, so read just that row via the section
+            # rather than loading the whole data array. Compressed HDUs only have a section from astropy 5.3 onwards,
+            # so they are decompressed in full instead
+            if isinstance(hdu, fits.CompImageHDU) or not hasattr(hdu, 'section'):
+                image = hdu.data
+            else:
+                image = hdu.section
+            dim = header['NAXIS']
+            if dim == 3:
+                flux = np.array(image[0, 0, :])
+            elif dim == 2:
+                flux = np.array(image[0, :])
+            elif dim == 1:
+                flux = np.array(hdu.data)
+            else:
+                raise InvalidFileFormatException('Unsupported number of dimensions in FITS spectrum')
+
+        # Wrap the 1-D flux array in place where possible, rather than copying it with the multiplication operator
+        if isinstance(flux_constant, units.UnitBase):
+            flux = units.Quantity(flux, flux_constant, copy=False)
+        else:
+            flux = flux * flux_constant
+
+        spectral_axis = self._get_linear_spectral_axis(header, flux.size)
+        if spectral_axis is not None:
+            spectrum = Spectrum1D(flux=flux, spectral_axis=spectral_axis * units.angstrom)
         else:
-            flux_constant = self.DEFAULT_FLUX_CONSTANT
-            date_obs = datetime.now()
+            header['CUNIT1'] = 'Angstrom'
+            wcs = WCS(header=header, naxis=1)
+            spectrum = Spectrum1D(flux=flux, wcs=wcs)
 
-        dim = len(flux.shape)
-        if dim == 3:
-            flux = flux[0, 0, :]
-        elif flux.shape[0] == 2:
-            flux = flux[0, :]
-        flux = flux * flux_constant
+        return spectrum, Time(date_obs).to_datetime()
 
-        header['CUNIT1'] = 'Angstrom'
-        wcs = WCS(header=header, naxis=1)
+    def _get_linear_spectral_axis(self, header, npix):
+        """
+        Computes the wavelengths of a spectrum with a linear dispersion directly from the header keywords of its first
+        axis, which avoids constructing a full WCS for the most common case.
 
-        spectrum = Spectrum1D(flux=flux, wcs=wcs)
+        :param header: FITS header of the spectrum
+        :type header: astropy.io.fits.Header
 
-        return spectrum, Time(date_obs).to_datetime()
+        :param npix: Number of pixels in the spectrum
+        :type npix: int
+
+        :returns: Array of wavelengths, or None if the dispersion is not a simple linear one
+        :rtype: numpy.ndarray
+        """
+        ctype = header.get('CTYPE1', '').strip().upper()
+        if ctype not in ('', 'LINEAR', 'WAVE') or header.get('DC-FLAG', 0) == 1 or 'PC1_1' in header:
+            return None
+
+        # As in the WCS standard, CD1_1 takes precedence over CDELT1 when both are present
+        cdelt = header.get('CD1_1', header.get('CDELT1'))
+        if cdelt is None or 'CRVAL1' not in header:
+            return None
+
+        # A missing CRPIX1 defaults to 0, as it does in astropy.wcs
+        pixels = np.arange(npix)
+        return header['CRVAL1'] + (pixels + 1 - header.get('CRPIX1', 0)) * cdelt
 
     def _process_spectrum_from_plaintext(self, data_product):
         """
         Processes the data from a spectrum from a plaintext file into a Spectrum1D object, which can then be serialized
-        and stored as a ReducedDatum for further processing or display. File is read using astropy as specified in
-        the below documentation. The file is expected to be a multi-column delimited file, with headers for wavelength
-        and flux. The file also requires comments containing, at minimum, 'DATE-OBS: [value]', where value is an
-        Astropy Time module-readable date. It can optionally contain 'FACILITY: [value]', where the facility is a string
-        matching the name of a valid facility in the TOM.
-        # http://docs.astropy.org/en/stable/io/ascii/read.html
+        and stored as a ReducedDatum for further processing or display. The file is expected to be a multi-column
+        comma- or whitespace-delimited file, with headers for wavelength and flux. The file also requires comments
+        containing, at minimum, 'DATE-OBS: [value]', where value is an Astropy Time module-readable date. It can
+        optionally contain 'FACILITY: [value]', where the facility is a string matching the name of a valid facility in
+        the TOM.
 
         Parameters
         ----------
@@ -111,12 +171,26 @@ class SpectroscopyProcessor(DataProcessor):
         :rtype: AstroPy.Time
         """
 
-        data = ascii.read(data_product.data.path)
-        if len(data) < 1:
+        with open(data_product.data.path) as spectrum_file:
+            lines = spectrum_file.read().splitlines()
+
+        comments = [line.lstrip()[1:].strip() for line in lines if line.lstrip().startswith('#')]
+        rows = [line for line in lines if line.strip() and not line.lstrip().startswith('#')]
+        if len(rows) < 2:
             raise InvalidFileFormatException('Empty table or invalid file type')
+
+        # The first non-comment row holds the column names, which may be quoted, and the remaining rows are parsed
+        # directly by numpy
+        delimiter = ',' if ',' in rows[0] else None
+        columns = [column.strip().strip('"\'') for column in rows[0].split(delimiter)]
+        try:
+            data = np.loadtxt(rows[1:], delimiter=delimiter, ndmin=2,
+                              usecols=(columns.index('wavelength'), columns.index('flux')))
+        except ValueError:
+            raise InvalidFileFormatException('Empty table or invalid file type')
+
         facility_name = None
         date_obs = datetime.now()
-        comments = data.meta.get('comments', [])
 
         for comment in comments:
             if 'date-obs' in comment.lower():
@@ -128,8 +202,8 @@ class SpectroscopyProcessor(DataProcessor):
         wavelength_units = facility.get_wavelength_units() if facility else self.DEFAULT_WAVELENGTH_UNITS
         flux_constant = facility.get_flux_constant() if facility else self.DEFAULT_FLUX_CONSTANT
 
-        spectral_axis = np.array(data['wavelength']) * wavelength_units
-        flux = np.array(data['flux']) * flux_constant
+        spectral_axis = data[:, 0] * wavelength_units
+        flux = data[:, 1] * flux_constant
         spectrum = Spectrum1D(flux=flux, spectral_axis=spectral_axis)
 
         return spectrum, Time(date_obs).to_datetime()
@@ -6,6 +6,8 @@ from django.test import TestCase, override_settings
 from django.conf import settings
 from django.contrib.auth.models import Group, User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from unittest.mock import patch
 from datetime import date, time
@@ -13,17 +15,19 @@ from specutils import Spectrum1D
 from astropy import units
 from astropy.io import fits
 from astropy.table import Table
+from astropy.wcs import WCS
 import numpy as np
 
 from tom_observations.tests.utils import FakeRoboticFacility
 from tom_observations.tests.factories import TargetFactory, ObservingRecordFactory
-from tom_dataproducts.models import DataProduct, is_fits_image_file
+from tom_dataproducts.models import DataProduct, DataProductGroup, is_fits_image_file
 from tom_dataproducts.forms import DataProductUploadForm
 from tom_dataproducts.processors.photometry_processor import PhotometryProcessor
 from tom_dataproducts.processors.spectroscopy_processor import SpectroscopyProcessor
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.utils import create_image_dataproduct
+from tom_dataproducts.data_processor import process_data_product, run_data_processors
 from guardian.shortcuts import assign_perm
 
 
@@ -68,6 +72,80 @@ class Views(TestCase):
         response = self.client.get(reverse('tom_dataproducts:list'))
         self.assertContains(response, 'afile.fits')
 
+    def test_dataproduct_list_queries(self, dp_mock):
+        group = DataProductGroup.objects.create(name='agroup')
+        self.data_product.group.add(group)
+        with CaptureQueriesContext(connection) as single_product_queries:
+            self.client.get(reverse('tom_dataproducts:list'))
+
+        for i in range(3):
+            data_product = DataProduct.objects.create(
+                product_id='testproductid{}'.format(i),
+                target=self.target,
+                observation_record=self.observation_record,
+                data=SimpleUploadedFile('afile{}.fits'.format(i), b'somedata')
+            )
+            data_product.group.add(group)
+        with CaptureQueriesContext(connection) as multiple_product_queries:
+            self.client.get(reverse('tom_dataproducts:list'))
+
+        self.assertEqual(len(single_product_queries), len(multiple_product_queries))
+        for query in multiple_product_queries.captured_queries:
+            self.assertNotIn('"tom_dataproducts_dataproduct"."extra_data"', query['sql'])
+            self.assertNotIn('"tom_observations_observationrecord"."parameters"', query['sql'])
+
+    def test_remove_dataproducts_from_group(self, dp_mock):
+        group = DataProductGroup.objects.create(name='agroup')
+        other_product = DataProduct.objects.create(
+            product_id='otherproductid',
+            target=self.target,
+            data=SimpleUploadedFile('bfile.fits', b'somedata')
+        )
+        group.dataproduct_set.add(self.data_product, other_product)
+        modified = group.modified
+
+        response = self.client.post(reverse('tom_dataproducts:group-detail', kwargs={'pk': group.id}),
+                                    {'products': [self.data_product.id]})
+        self.assertRedirects(response, reverse('tom_dataproducts:group-detail', kwargs={'pk': group.id}),
+                             fetch_redirect_response=False)
+        self.assertEqual(list(group.dataproduct_set.all()), [other_product])
+        group.refresh_from_db()
+        self.assertGreater(group.modified, modified)
+
+    def test_feature_dataproduct(self, dp_mock):
+        self.data_product.data_product_type = 'image_file'
+        self.data_product.featured = True
+        self.data_product.save()
+        other_product = DataProduct.objects.create(
+            product_id='otherproductid',
+            target=self.target,
+            data_product_type='image_file',
+            data=SimpleUploadedFile('bfile.fits', b'somedata')
+        )
+        unfeatured_modified = self.data_product.modified
+        featured_modified = other_product.modified
+
+        response = self.client.get(
+            reverse('dataproducts:feature', kwargs={'pk': other_product.id}) + '?target_id={}'.format(self.target.id)
+        )
+        self.assertRedirects(response, reverse('tom_targets:detail', kwargs={'pk': self.target.id}),
+                             fetch_redirect_response=False)
+        self.data_product.refresh_from_db()
+        other_product.refresh_from_db()
+        self.assertFalse(self.data_product.featured)
+        self.assertTrue(other_product.featured)
+        self.assertGreater(self.data_product.modified, unfeatured_modified)
+        self.assertGreater(other_product.modified, featured_modified)
+
+    def test_feature_dataproduct_without_target_id(self, dp_mock):
+        response = self.client.get(reverse('dataproducts:feature', kwargs={'pk': self.data_product.id}))
+        self.assertRedirects(response, reverse('tom_targets:detail', kwargs={'pk': self.target.id}),
+                             fetch_redirect_response=False)
+
+    def test_feature_missing_dataproduct(self, dp_mock):
+        response = self.client.get(reverse('dataproducts:feature', kwargs={'pk': self.data_product.id + 1}))
+        self.assertEqual(response.status_code, 404)
+
     def test_get_dataproducts(self, dp_mock):
         response = self.client.get(reverse('tom_observations:detail', kwargs={'pk': self.observation_record.id}))
         self.assertContains(response, 'testdpid')
@@ -83,6 +161,18 @@ class Views(TestCase):
             self.assertTrue(mock.called)
             self.assertContains(response, 'Successfully saved: afile.fits')
 
+    def test_save_multiple_dataproducts(self, dp_mock):
+        def save_data_products(observation_record, product_id=None):
+            return [DataProduct(product_id=product_id, data=SimpleUploadedFile(f'{product_id}.fits', b'afile'))]
+        with patch.object(FakeRoboticFacility, 'save_data_products', side_effect=save_data_products) as mock:
+            response = self.client.post(
+                reverse('dataproducts:save', kwargs={'pk': self.observation_record.id}),
+                data={'facility': 'FakeRoboticFacility', 'products': ['testdpid', 'otherdpid']},
+                follow=True
+            )
+            self.assertEqual(mock.call_count, 2)
+            self.assertContains(response, 'Successfully saved: testdpid.fits\notherdpid.fits')
+
     # Non-FITS file
     def test_is_fits_image_file_invalid_fits(self, dp_mock):
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -217,7 +307,7 @@ class TestViewsWithPermissions(TestCase):
 
 @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'],
                    TARGET_PERMISSIONS_ONLY=True)
-@patch('tom_dataproducts.views.run_data_processor')
+@patch('tom_dataproducts.data_processor._process_data')
 class TestUploadDataProducts(TestCase):
     def setUp(self):
         self.target = TargetFactory.create()
@@ -236,7 +326,7 @@ class TestUploadDataProducts(TestCase):
         assign_perm('tom_targets.view_target', self.user, self.target)
         self.client.force_login(self.user)
 
-    def test_upload_data_for_target(self, run_data_processor_mock):
+    def test_upload_data_for_target(self, process_data_mock):
         response = self.client.post(
             reverse('dataproducts:upload'),
             {
@@ -252,7 +342,7 @@ class TestUploadDataProducts(TestCase):
         )
         self.assertContains(response, 'Successfully uploaded: {0}/none/afile.fits'.format(self.target.name))
 
-    def test_upload_data_for_observation(self, run_data_processor_mock):
+    def test_upload_data_for_observation(self, process_data_mock):
         response = self.client.post(
             reverse('dataproducts:upload'),
             {
@@ -270,6 +360,89 @@ class TestUploadDataProducts(TestCase):
             self.target.name, FakeRoboticFacility.name)
         )
 
+    def test_upload_data_invalid_file(self, process_data_mock):
+        process_data_mock.side_effect = InvalidFileFormatException('Unsupported file type')
+        response = self.client.post(
+            reverse('dataproducts:upload'),
+            {
+                'facility': 'LCO',
+                'files': [SimpleUploadedFile('cfile.fits', b'afile'), SimpleUploadedFile('dfile.fits', b'afile')],
+                'target': self.target.id,
+                'data_product_type': settings.DATA_PRODUCT_TYPES['spectroscopy'][0],
+                'referrer': reverse('targets:detail', kwargs={'pk': self.target.id})
+            },
+            follow=True
+        )
+        self.assertContains(response, 'File format invalid for file {0}/none/cfile.fits'.format(self.target.name))
+        self.assertContains(response, 'File format invalid for file {0}/none/dfile.fits'.format(self.target.name))
+        self.assertEqual(DataProduct.objects.filter(target=self.target).count(), 1)
+
+    @override_settings(DATA_PROCESSING_DISPATCHER='tests.dispatch_data_product')
+    @patch('tom_dataproducts.views.transaction.on_commit', side_effect=lambda func: func())
+    @patch('tom_dataproducts.views.import_method')
+    def test_upload_data_dispatched(self, import_method_mock, on_commit_mock, process_data_mock):
+        response = self.client.post(
+            reverse('dataproducts:upload'),
+            {
+                'facility': 'LCO',
+                'files': SimpleUploadedFile('efile.fits', b'afile'),
+                'target': self.target.id,
+                'data_product_type': settings.DATA_PRODUCT_TYPES['spectroscopy'][0],
+                'referrer': reverse('targets:detail', kwargs={'pk': self.target.id})
+            },
+            follow=True
+        )
+        self.assertContains(response, 'Uploaded and queued for processing: {0}/none/efile.fits'.format(
+            self.target.name)
+        )
+        dp = DataProduct.objects.get(data='{0}/none/efile.fits'.format(self.target.name))
+        import_method_mock.assert_called_once_with('tests.dispatch_data_product')
+        on_commit_mock.assert_called_once()
+        import_method_mock.return_value.assert_called_once_with(dp.pk, [])
+        process_data_mock.assert_not_called()
+
+    @patch('tom_dataproducts.data_processor.run_data_processor')
+    def test_process_data_product_invalid_file(self, run_data_processor_mock, process_data_mock):
+        run_data_processor_mock.side_effect = InvalidFileFormatException('Unsupported file type')
+        with self.assertRaises(InvalidFileFormatException):
+            process_data_product(self.data_product.pk)
+        self.assertFalse(DataProduct.objects.filter(pk=self.data_product.pk).exists())
+
+    def test_run_data_processors(self, process_data_mock):
+        other_data_product = DataProduct.objects.create(
+            product_id='otherproductid',
+            target=self.target,
+            data=SimpleUploadedFile('bfile.fits', b'somedata')
+        )
+
+        def process_data(dp):
+            if dp == other_data_product:
+                raise InvalidFileFormatException('Unsupported file type')
+            return [(date(2019, 6, 1), json.dumps({'magnitude': 15.0}))]
+        process_data_mock.side_effect = process_data
+
+        results = list(run_data_processors([self.data_product, other_data_product], max_workers=1))
+        self.assertEqual([result[0] for result in results], [self.data_product, other_data_product])
+        self.assertEqual(results[0][1].count(), 1)
+        self.assertIsNone(results[0][2])
+        self.assertIsNone(results[1][1])
+        self.assertIsInstance(results[1][2], InvalidFileFormatException)
+
+    @patch('tom_dataproducts.data_processor.ThreadPoolExecutor')
+    def test_run_data_processors_sequential_by_default(self, executor_mock, process_data_mock):
+        process_data_mock.return_value = []
+        results = list(run_data_processors([self.data_product]))
+        self.assertEqual(results[0][0], self.data_product)
+        executor_mock.assert_not_called()
+
+    @override_settings(DATA_PROCESSING_WORKERS=2)
+    @patch('tom_dataproducts.data_processor.connection')
+    def test_run_data_processors_threaded(self, connection_mock, process_data_mock):
+        process_data_mock.return_value = [(date(2019, 6, 1), json.dumps({'magnitude': 15.0}))]
+        results = list(run_data_processors([self.data_product]))
+        self.assertEqual(results[0][1].count(), 1)
+        connection_mock.close.assert_called_once()
+
 
 class TestDeleteDataProducts(TestCase):
     def setUp(self):
@@ -306,6 +479,41 @@ class TestDeleteDataProducts(TestCase):
         self.assertRedirects(response, reverse('home'))
         self.assertFalse(DataProduct.objects.filter(product_id='testproductid').exists())
 
+    def test_delete_data_product_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('dataproducts:delete', kwargs={'pk': self.data_product.id}))
+        data_product_selects = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "tom_dataproducts_dataproduct"' in query['sql']
+        ]
+        self.assertEqual(len(data_product_selects), 1)
+        self.assertFalse(os.path.exists(self.data_product.data.path))
+
+
+class TestUpdateReducedData(TestCase):
+    def setUp(self):
+        self.target = TargetFactory.create()
+        self.user = User.objects.create_user(username='test', email='test@example.com')
+        self.client.force_login(self.user)
+
+    @override_settings(REDUCED_DATA_UPDATE_DISPATCHER='tests.dispatch_reduced_data_update')
+    @patch('tom_dataproducts.views.call_command')
+    @patch('tom_dataproducts.views.import_method')
+    def test_update_reduced_data_dispatched(self, import_method_mock, call_command_mock):
+        response = self.client.get(reverse('dataproducts:update-reduced-data') + f'?target_id={self.target.id}',
+                                   follow=True)
+        self.assertContains(response, 'Update started in the background')
+        import_method_mock.return_value.assert_called_once_with(self.target.id)
+        call_command_mock.assert_not_called()
+
+    @override_settings(REDUCED_DATA_UPDATE_DISPATCHER='tests.dispatch_reduced_data_update')
+    @patch('tom_dataproducts.views.call_command')
+    @patch('tom_dataproducts.views.import_method')
+    def test_update_all_reduced_data_dispatched(self, import_method_mock, call_command_mock):
+        self.client.get(reverse('dataproducts:update-reduced-data'))
+        import_method_mock.return_value.assert_called_once_with(None)
+        call_command_mock.assert_not_called()
+
 
 class TestDataUploadForms(TestCase):
     def setUp(self):
@@ -420,6 +628,28 @@ class TestDataProcessor(TestCase):
             self.assertAlmostEqual(spectrum.flux.mean().value, 2.295068e-14, places=19)
             self.assertAlmostEqual(spectrum.wavelength.mean().value, 6600.478789, places=5)
 
+    def test_process_spectrum_from_compressed_fits(self):
+        data = np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]], dtype=np.float32)
+        header = fits.Header({'CRVAL1': 5000.0, 'CDELT1': 2.0, 'CRPIX1': 1})
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'spectrum.fits.fz')
+            fits.HDUList([fits.PrimaryHDU(), fits.CompImageHDU(data, header=header)]).writeto(path)
+            with open(path, 'rb') as spectrum_file:
+                self.data_product.data.save('spectrum.fits.fz', spectrum_file)
+        spectrum, _ = self.spectrum_data_processor._process_spectrum_from_fits(self.data_product)
+        np.testing.assert_allclose(spectrum.flux.value, [1.0, 2.0, 3.0])
+        np.testing.assert_allclose(spectrum.wavelength.value, [5000.0, 5002.0, 5004.0])
+
+    def test_linear_spectral_axis_matches_wcs(self):
+        for crpix in [None, 1, 10.5]:
+            with self.subTest(crpix=crpix):
+                header = fits.Header({'NAXIS': 1, 'NAXIS1': 5, 'CRVAL1': 5000.0, 'CDELT1': 2.0})
+                if crpix is not None:
+                    header['CRPIX1'] = crpix
+                spectral_axis = self.spectrum_data_processor._get_linear_spectral_axis(header, 5)
+                expected = WCS(header).pixel_to_world_values(np.arange(5))
+                np.testing.assert_allclose(spectral_axis, expected)
+
     def test_process_spectrum_from_plaintext(self):
         with open('tom_dataproducts/tests/test_data/test_spectrum.csv', 'rb') as spectrum_file:
             self.data_product.data.save('spectrum.csv', spectrum_file)
@@ -428,6 +658,31 @@ class TestDataProcessor(TestCase):
             self.assertAlmostEqual(spectrum.flux.mean().value, 1.166619e-14, places=19)
             self.assertAlmostEqual(spectrum.wavelength.mean().value, 3250.744489, places=5)
 
+    def test_process_spectrum_from_plaintext_with_comments(self):
+        spectrum_file = SimpleUploadedFile(
+            'spectrum.csv',
+            b'# DATE-OBS: 2020-01-01\nflux, wavelength\n1.0e-14, 5000.0\n3.0e-14, 5001.0\n'
+        )
+        self.data_product.data.save('spectrum.csv', spectrum_file)
+        spectrum, date_obs = self.spectrum_data_processor._process_spectrum_from_plaintext(self.data_product)
+        self.assertAlmostEqual(spectrum.flux.mean().value, 2.0e-14, places=19)
+        self.assertAlmostEqual(spectrum.wavelength.mean().value, 5000.5, places=5)
+        self.assertEqual(date_obs.year, 2020)
+
+    def test_process_spectrum_from_plaintext_quoted_header(self):
+        for content in [b'"wavelength","flux"\n5000.0,1.0e-14\n5001.0,3.0e-14\n',
+                        b"'wavelength' 'flux'\n5000.0 1.0e-14\n5001.0 3.0e-14\n"]:
+            with self.subTest(content=content):
+                self.data_product.data.save('spectrum.csv', SimpleUploadedFile('spectrum.csv', content))
+                spectrum, _ = self.spectrum_data_processor._process_spectrum_from_plaintext(self.data_product)
+                self.assertAlmostEqual(spectrum.flux.mean().value, 2.0e-14, places=19)
+                self.assertAlmostEqual(spectrum.wavelength.mean().value, 5000.5, places=5)
+
+    def test_process_spectrum_from_plaintext_invalid_file(self):
+        self.data_product.data.save('spectrum.csv', SimpleUploadedFile('spectrum.csv', b'wavelength flux\n'))
+        with self.assertRaises(InvalidFileFormatException):
+            self.spectrum_data_processor._process_spectrum_from_plaintext(self.data_product)
+
     @patch('tom_dataproducts.processors.photometry_processor.PhotometryProcessor._process_photometry_from_plaintext')
     def test_process_photometry_with_plaintext_file(self, process_data_mock):
         self.data_product.data.save('lightcurve.csv', self.test_file)
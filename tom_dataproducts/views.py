@@ -1,3 +1,4 @@
+from functools import partial
 from io import StringIO
 from urllib.parse import urlparse
 
@@ -8,9 +9,11 @@ from django.contrib.auth.models import Group
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
 from django.core.management import call_command
+from django.db import transaction
 from django.http import HttpResponseRedirect
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.views.generic import View, ListView
 from django.views.generic.base import RedirectView
@@ -19,14 +22,14 @@ from django.views.generic.edit import CreateView, DeleteView, FormView
 from django_filters.views import FilterView
 from guardian.shortcuts import assign_perm, get_objects_for_user
 
-from tom_common.hooks import run_hook
+from tom_common.hooks import import_method, run_hook
 from tom_common.hints import add_hint
 from tom_common.mixins import Raise403PermissionRequiredMixin
 from tom_dataproducts.models import DataProduct, DataProductGroup, ReducedDatum
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.forms import AddProductToGroupForm, DataProductUploadForm
 from tom_dataproducts.filters import DataProductFilter
-from tom_dataproducts.data_processor import run_data_processor
+from tom_dataproducts.data_processor import run_data_processors
 from tom_observations.models import ObservationRecord
 from tom_observations.facility import get_service_class
 
@@ -50,20 +53,17 @@ class DataProductSaveView(LoginRequiredMixin, View):
         if not products:
             messages.warning(request, 'No products were saved, please select at least one dataproduct')
         elif products[0] == 'ALL':
-            products = service_class().save_data_products(observation_record)
+            service_class().save_data_products(observation_record)
             messages.success(request, 'Saved all available data products')
         else:
+            facility = service_class()
+            saved_products = []
             for product in products:
-                products = service_class().save_data_products(
-                    observation_record,
-                    product
-                )
-                messages.success(
-                    request,
-                    'Successfully saved: {0}'.format('\n'.join(
-                        [str(p) for p in products]
-                    ))
-                )
+                saved_products.extend(facility.save_data_products(observation_record, product))
+            messages.success(
+                request,
+                'Successfully saved: {0}'.format('\n'.join([str(p) for p in saved_products]))
+            )
         return redirect(reverse(
             'tom_observations:detail',
             kwargs={'pk': observation_record.id})
@@ -87,8 +87,9 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         """
-        Runs after ``DataProductUploadForm`` is validated. Saves each ``DataProduct`` and calls ``run_data_processor``
-        on each saved file. Redirects to the previous page.
+        Runs after ``DataProductUploadForm`` is validated. Saves each ``DataProduct`` and calls ``run_data_processors``
+        on the saved files, or hands each saved file to ``DATA_PROCESSING_DISPATCHER`` if one is configured. Redirects
+        to the previous page.
         """
         target = form.cleaned_data['target']
         if not target:
@@ -98,7 +99,11 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
             observation_record = None
         dp_type = form.cleaned_data['data_product_type']
         data_product_files = self.request.FILES.getlist('files')
+        dispatcher = getattr(settings, 'DATA_PROCESSING_DISPATCHER', None)
+        data_products = []
         successful_uploads = []
+        queued_uploads = []
+        failed_uploads = []
         for f in data_product_files:
             dp = DataProduct(
                 target=target,
@@ -108,30 +113,48 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
                 data_product_type=dp_type
             )
             dp.save()
+            if dispatcher:
+                # Only hand the file over once it is committed, so that the background task can always find it
+                transaction.on_commit(partial(
+                    import_method(dispatcher), dp.pk, [group.pk for group in form.cleaned_data.get('groups', [])]
+                ))
+                queued_uploads.append(str(dp))
+                continue
             try:
                 run_hook('data_product_post_upload', dp)
-                reduced_data = run_data_processor(dp)
+                data_products.append(dp)
+            except Exception:
+                failed_uploads.append(dp.pk)
+                messages.error(self.request, 'There was a problem processing your file: {0}'.format(str(dp)))
+        for dp, reduced_data, exception in run_data_processors(data_products):
+            if isinstance(exception, InvalidFileFormatException):
+                failed_uploads.append(dp.pk)
+                messages.error(
+                    self.request,
+                    'File format invalid for file {0} -- error was {1}'.format(str(dp), exception)
+                )
+            elif exception is not None:
+                failed_uploads.append(dp.pk)
+                messages.error(self.request, 'There was a problem processing your file: {0}'.format(str(dp)))
+            else:
                 if not settings.TARGET_PERMISSIONS_ONLY:
                     for group in form.cleaned_data['groups']:
                         assign_perm('tom_dataproducts.view_dataproduct', group, dp)
                         assign_perm('tom_dataproducts.delete_dataproduct', group, dp)
                         assign_perm('tom_dataproducts.view_reduceddatum', group, reduced_data)
                 successful_uploads.append(str(dp))
-            except InvalidFileFormatException as iffe:
-                ReducedDatum.objects.filter(data_product=dp).delete()
-                dp.delete()
-                messages.error(
-                    self.request,
-                    'File format invalid for file {0} -- error was {1}'.format(str(dp), iffe)
-                )
-            except Exception:
-                ReducedDatum.objects.filter(data_product=dp).delete()
-                dp.delete()
-                messages.error(self.request, 'There was a problem processing your file: {0}'.format(str(dp)))
+        if failed_uploads:
+            ReducedDatum.objects.filter(data_product__in=failed_uploads).delete()
+            DataProduct.objects.filter(pk__in=failed_uploads).delete()
         if successful_uploads:
             messages.success(
                 self.request,
-                'Successfully uploaded: {0}'.format('\n'.join([p for p in successful_uploads]))
+                'Successfully uploaded: {0}'.format('\n'.join(successful_uploads))
+            )
+        if queued_uploads:
+            messages.success(
+                self.request,
+                'Uploaded and queued for processing: {0}'.format('\n'.join(queued_uploads))
             )
 
         return redirect(form.cleaned_data.get('referrer', '/'))
@@ -174,17 +197,27 @@ class DataProductDeleteView(Raise403PermissionRequiredMixin, DeleteView):
         referer = urlparse(referer).path if referer else '/'
         return referer
 
+    def get_object(self, queryset=None):
+        """
+        Returns the ``DataProduct`` being deleted, which is only queried for once per request.
+        """
+        if not hasattr(self, '_object'):
+            self._object = super().get_object(queryset=queryset)
+        return self._object
+
     def delete(self, request, *args, **kwargs):
         """
         Method that handles DELETE requests for this view. First deletes all ``ReducedDatum`` objects associated with
-        the ``DataProduct``, then deletes the ``DataProduct``.
+        the ``DataProduct``, then deletes the ``DataProduct`` and its file.
 
         :param request: Django POST request object
         :type request: HttpRequest
         """
-        ReducedDatum.objects.filter(data_product=self.get_object()).delete()
-        self.get_object().data.delete()
-        return super().delete(request, *args, **kwargs)
+        data_product = self.get_object()
+        with transaction.atomic():
+            ReducedDatum.objects.filter(data_product=data_product).delete()
+            data_product.data.delete(save=False)
+            return super().delete(request, *args, **kwargs)
 
     def get_context_data(self, *args, **kwargs):
         """
@@ -217,11 +250,18 @@ class DataProductListView(FilterView):
         :rtype: QuerySet
         """
         if settings.TARGET_PERMISSIONS_ONLY:
-            return super().get_queryset().filter(
+            queryset = super().get_queryset().filter(
                 target__in=get_objects_for_user(self.request.user, 'tom_targets.view_target')
             )
         else:
-            return get_objects_for_user(self.request.user, 'tom_dataproducts.view_dataproduct')
+            queryset = get_objects_for_user(self.request.user, 'tom_dataproducts.view_dataproduct')
+        # The list displays the target, observation record and groups of each product, but never the free-form text
+        # columns, which can be large
+        return queryset.select_related(
+            'target', 'observation_record', 'observation_record__target'
+        ).defer(
+            'extra_data', 'observation_record__parameters'
+        ).prefetch_related('group')
 
     def get_context_data(self, *args, **kwargs):
         """
@@ -246,29 +286,19 @@ class DataProductFeatureView(View):
         database, and sets the specified ``DataProduct`` to featured. Caches the featured image. Deletes previously
         featured images from the cache.
         """
-        product_id = kwargs.get('pk', None)
-        product = DataProduct.objects.get(pk=product_id)
-        try:
-            current_featured = DataProduct.objects.filter(
+        product = get_object_or_404(DataProduct, pk=kwargs.get('pk', None))
+        with transaction.atomic():
+            DataProduct.objects.filter(
                 featured=True,
                 data_product_type=product.data_product_type,
-                target=product.target
-            )
-            for featured_image in current_featured:
-                featured_image.featured = False
-                featured_image.save()
-                featured_image_cache_key = make_template_fragment_key(
-                    'featured_image',
-                    str(featured_image.target.id)
-                )
-                cache.delete(featured_image_cache_key)
-        except DataProduct.DoesNotExist:
-            pass
-        product.featured = True
-        product.save()
+                target_id=product.target_id
+            ).update(featured=False, modified=timezone.now())
+            product.featured = True
+            product.save(update_fields=['featured', 'modified'])
+        cache.delete(make_template_fragment_key('featured_image', str(product.target_id)))
         return redirect(reverse(
             'tom_targets:detail',
-            kwargs={'pk': request.GET.get('target_id')})
+            kwargs={'pk': request.GET.get('target_id', product.target_id)})
         )
 
 
@@ -283,9 +313,9 @@ class DataProductGroupDetailView(DetailView):
         Handles the POST request for this view.
         """
         group = self.get_object()
-        for product in request.POST.getlist('products'):
-            group.dataproduct_set.remove(DataProduct.objects.get(pk=product))
-        group.save()
+        group.dataproduct_set.remove(*DataProduct.objects.filter(pk__in=request.POST.getlist('products')))
+        # Editing the relation does not touch the group row, so bump its modified time explicitly
+        group.save(update_fields=['modified'])
         return redirect(reverse(
             'tom_dataproducts:group-detail',
             kwargs={'pk': group.id})
@@ -332,7 +362,7 @@ class DataProductGroupDataView(LoginRequiredMixin, FormView):
         """
         group = form.cleaned_data['group']
         group.dataproduct_set.add(*form.cleaned_data['products'])
-        group.save()
+        group.save(update_fields=['modified'])
         return redirect(reverse(
             'tom_dataproducts:group-detail',
             kwargs={'pk': group.id})
@@ -346,16 +376,22 @@ class UpdateReducedDataView(LoginRequiredMixin, RedirectView):
     """
     def get(self, request, *args, **kwargs):
         """
-        Method that handles the GET requests for this view. Calls the management command to update the reduced data and
-        adds a hint using the messages framework about automation.
+        Method that handles the GET requests for this view. Calls the management command to update the reduced data, or
+        hands the update to ``REDUCED_DATA_UPDATE_DISPATCHER`` if one is configured, and adds a hint using the messages
+        framework about automation.
         """
         target_id = request.GET.get('target_id', None)
-        out = StringIO()
-        if target_id:
-            call_command('updatereduceddata', target_id=target_id, stdout=out)
+        dispatcher = getattr(settings, 'REDUCED_DATA_UPDATE_DISPATCHER', None)
+        if dispatcher:
+            import_method(dispatcher)(int(target_id) if target_id else None)
+            messages.info(request, 'Update started in the background')
         else:
-            call_command('updatereduceddata', stdout=out)
-        messages.info(request, out.getvalue())
+            out = StringIO()
+            if target_id:
+                call_command('updatereduceddata', target_id=target_id, stdout=out)
+            else:
+                call_command('updatereduceddata', stdout=out)
+            messages.info(request, out.getvalue())
         add_hint(request, mark_safe(
                           'Did you know updating observation statuses can be automated? Learn how in '
                           '<a href=https://tom-toolkit.readthedocs.io/en/stable/customization/automation.html>'
@@ -1,13 +1,18 @@
+from functools import lru_cache
+
 from django import forms
 from django.urls import reverse
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import ButtonHolder, Column, Layout, Row, Submit
 
+from tom_common.caching import clear_on_setting_changed
 from tom_observations.facility import get_service_classes
 
 
+@clear_on_setting_changed('TOM_FACILITY_CLASSES')
+@lru_cache(maxsize=1)
 def facility_choices():
-    return [(k, k) for k in get_service_classes().keys()]
+    return tuple((k, k) for k in get_service_classes().keys())
 
 
 class AddExistingObservationForm(forms.Form):
@@ -5,12 +5,13 @@ from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 
-from astroplan import FixedTarget
+from astroplan import FixedTarget, Observer
 from astropy.coordinates import get_sun, SkyCoord
 from astropy.time import Time
 
 from .factories import ObservingRecordFactory, ObservingStrategyFactory, TargetFactory, TargetNameFactory
-from tom_observations.utils import get_astroplan_sun_and_time, get_sidereal_visibility
+from tom_observations.forms import facility_choices
+from tom_observations.utils import _get_observing_sites, get_astroplan_sun_and_time, get_sidereal_visibility
 from tom_observations.tests.utils import FakeRoboticFacility
 from tom_observations.models import ObservationRecord, ObservationGroup, ObservingStrategy
 from tom_targets.models import Target
@@ -235,8 +236,19 @@ class TestUpdatingObservations(TestCase):
             self.assertEquals(uos_mock.call_count, 2)
 
 
+class TestFacilityChoices(TestCase):
+    @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'])
+    def test_facility_choices(self):
+        self.assertEqual(facility_choices(), (('FakeRoboticFacility', 'FakeRoboticFacility'),))
+        with override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeManualFacility']):
+            self.assertEqual(facility_choices(), (('FakeManualFacility', 'FakeManualFacility'),))
+
+
 class TestGetVisibility(TestCase):
     def setUp(self):
+        # The observing sites are cached, so they have to be cleared for the mocked facilities to be used
+        _get_observing_sites.cache_clear()
+        self.addCleanup(_get_observing_sites.cache_clear)
         self.sun = get_sun(Time(datetime(2019, 10, 9, 13, 56)))
         self.target = Target(
             ra=(self.sun.ra.deg + 180) % 360,
@@ -297,3 +309,35 @@ class TestGetVisibility(TestCase):
         self.assertEqual(len(airmass_data), len(expected_airmass))
         for i in range(0, len(expected_airmass)):
             self.assertAlmostEqual(airmass_data[i], expected_airmass[i], places=3)
+
+    @mock.patch('tom_observations.utils.facility.get_service_classes')
+    def test_get_visibility_sidereal_airmass_limit(self, mock_facility):
+        mock_facility.return_value = {'Fake Robotic Facility': FakeRoboticFacility}
+        end = self.start + timedelta(minutes=60)
+        airmass = get_sidereal_visibility(self.target, self.start, end, self.interval, 1.275)
+        airmass_data = airmass['(Fake Robotic Facility) Siding Spring'][1]
+        self.assertEqual(airmass_data[3:], [None, None, None, None])
+        for i, expected_airmass in enumerate([1.2619096566629477, 1.2648181328558852, 1.2703522349950636]):
+            self.assertAlmostEqual(airmass_data[i], expected_airmass, places=3)
+
+    @mock.patch('tom_observations.utils.facility.get_service_classes')
+    def test_get_visibility_sidereal_daytime(self, mock_facility):
+        mock_facility.return_value = {'Fake Robotic Facility': FakeRoboticFacility}
+        # Both of the fake facility's sites are in daylight for this whole window
+        start = datetime(2018, 10, 9, 1, 0, 0)
+        end = start + timedelta(minutes=60)
+        with mock.patch('tom_observations.utils.Observer.altaz', autospec=True,
+                        side_effect=Observer.altaz) as mock_altaz:
+            airmass = get_sidereal_visibility(self.target, start, end, self.interval, self.airmass_limit)
+        self.assertEqual(airmass['(Fake Robotic Facility) Siding Spring'][1], [None] * 7)
+        self.assertEqual(airmass['(Fake Robotic Facility) Los Angeles'][1], [None] * 7)
+        # Only the sun is transformed, once for each site
+        self.assertEqual(mock_altaz.call_count, 2)
+
+    @mock.patch('tom_observations.utils.facility.get_service_classes')
+    def test_get_visibility_sites_cached(self, mock_facility):
+        mock_facility.return_value = {'Fake Robotic Facility': FakeRoboticFacility}
+        end = self.start + timedelta(minutes=60)
+        get_sidereal_visibility(self.target, self.start, end, self.interval, self.airmass_limit)
+        get_sidereal_visibility(self.target, self.start, end, self.interval, self.airmass_limit)
+        self.assertEqual(mock_facility.call_count, 1)
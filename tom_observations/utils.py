@@ -2,14 +2,30 @@ from astropy.coordinates import get_sun, SkyCoord
 from astropy import units
 from astropy.time import Time
 from astroplan import Observer, FixedTarget, time_grid_from_range
+from functools import lru_cache
 import numpy as np
 import logging
 
+from tom_common.caching import clear_on_setting_changed
 from tom_observations import facility
 
 logger = logging.getLogger(__name__)
 
 
+@clear_on_setting_changed('TOM_FACILITY_CLASSES')
+@lru_cache(maxsize=1)
+def _get_observing_sites():
+    """
+    Returns a tuple of (facility name, site name, site details) for every site of every configured facility, so that
+    the facilities are only imported and instantiated once rather than for every visibility calculation.
+    """
+    return tuple(
+        (facility_name, site, site_details)
+        for facility_name, facility_class in facility.get_service_classes().items()
+        for site, site_details in facility_class().get_observing_sites().items()
+    )
+
+
 def get_sidereal_visibility(target, start_time, end_time, interval, airmass_limit):
     """
     Uses astroplan to calculate the airmass for a sidereal target
@@ -57,26 +73,26 @@ def get_sidereal_visibility(target, start_time, end_time, interval, airmass_limi
 
     visibility = {}
     sun, time_range = get_astroplan_sun_and_time(start_time, end_time, interval)
-    for observing_facility in facility.get_service_classes():
-        observing_facility_class = facility.get_service_class(observing_facility)
-        sites = observing_facility_class().get_observing_sites()
-        for site, site_details in sites.items():
-            observer = Observer(longitude=site_details.get('longitude')*units.deg,
-                                latitude=site_details.get('latitude')*units.deg,
-                                elevation=site_details.get('elevation')*units.m)
-
-            sun_alt = observer.altaz(time_range, sun).alt
-            obj_airmass = observer.altaz(time_range, body).secz
-
-            bad_indices = np.argwhere(
-                (obj_airmass >= airmass_limit) |
-                (obj_airmass <= 1) |
-                (sun_alt > -18*units.deg)  # between astronomical twilights, i.e. sun is up
-            )
-
-            obj_airmass = [None if i in bad_indices else float(airmass) for i, airmass in enumerate(obj_airmass)]
-
-            visibility[f'({observing_facility}) {site}'] = (time_range.datetime, obj_airmass)
+    datetimes = time_range.datetime
+    for observing_facility, site, site_details in _get_observing_sites():
+        observer = Observer(longitude=site_details.get('longitude')*units.deg,
+                            latitude=site_details.get('latitude')*units.deg,
+                            elevation=site_details.get('elevation')*units.m)
+
+        sun_up = observer.altaz(time_range, sun).alt > -18*units.deg  # between astronomical twilights
+        if np.all(sun_up):
+            # Every point would be rejected, so skip transforming the target
+            visibility[f'({observing_facility}) {site}'] = (datetimes, [None] * len(time_range))
+            continue
+
+        obj_airmass = observer.altaz(time_range, body).secz
+
+        bad_mask = (obj_airmass >= airmass_limit) | (obj_airmass <= 1) | sun_up
+
+        obj_airmass = [None if bad else airmass
+                       for airmass, bad in zip(np.asarray(obj_airmass, dtype=float).tolist(), bad_mask.tolist())]
+
+        visibility[f'({observing_facility}) {site}'] = (datetimes, obj_airmass)
     return visibility
 
 
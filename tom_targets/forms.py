@@ -34,18 +34,22 @@ class CoordinateField(forms.CharField):
         super().__init__(*args, **kwargs)
 
     def to_python(self, value):
-        try:
-            a = float(value)
-            return a
-        except ValueError:
+        if isinstance(value, (int, float)):
+            return float(value)
+        # Sexigesimal values always contain a separator, so don't attempt to parse them as degrees first
+        if ':' not in value and ' ' not in value.strip():
             try:
-                if self.c_type == 'ra':
-                    a = Angle(value, unit=u.hourangle)
-                else:
-                    a = Angle(value, unit=u.degree)
-                return a.to(u.degree).value
-            except Exception:
-                raise ValidationError('Invalid format. Please use sexigesimal or degrees')
+                return float(value)
+            except ValueError:
+                pass
+        try:
+            if self.c_type == 'ra':
+                a = Angle(value, unit=u.hourangle)
+            else:
+                a = Angle(value, unit=u.degree)
+            return a.to(u.degree).value
+        except Exception:
+            raise ValidationError('Invalid format. Please use sexigesimal or degrees')
 
 
 class TargetForm(forms.ModelForm):
@@ -429,6 +429,14 @@ class TargetExtra(models.Model):
         Saves TargetExtra model data to the database. In the process, converts the string value of the ``TargetExtra``
         to the appropriate type, and stores it in the corresponding field as well.
         """
+        self.set_typed_values()
+        super().save(*args, **kwargs)
+
+    def set_typed_values(self):
+        """
+        Converts the string value of the ``TargetExtra`` to float, boolean and datetime, and stores each in the
+        corresponding field. Called by ``save``, and should be called before any ``bulk_create``, which bypasses it.
+        """
         try:
             self.float_value = float(self.value)
         except (TypeError, ValueError, OverflowError):
@@ -445,8 +453,6 @@ class TargetExtra(models.Model):
         except (TypeError, ValueError, OverflowError):
             self.time_value = None
 
-        super().save(*args, **kwargs)
-
     def typed_value(self, type_val):
         """
         Returns the value of this ``TargetExtra`` in the corresponding type provided by the caller. If the type is
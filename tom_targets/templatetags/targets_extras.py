@@ -1,24 +1,38 @@
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
 
 from astroplan import moon_illumination
 from astropy import units as u
-from astropy.coordinates import Angle, get_moon, SkyCoord
+from astropy.coordinates import Angle, get_moon
 from astropy.time import Time
 from dateutil.parser import parse
 from django import template
 from django.conf import settings
+from django.core.cache import cache
 from guardian.shortcuts import get_objects_for_user
 import numpy as np
 from plotly import offline
 from plotly import graph_objs as go
 
 from tom_observations.utils import get_sidereal_visibility
-from tom_targets.models import Target, TargetExtra, TargetList
+from tom_targets.models import Target, TargetList
 from tom_targets.forms import TargetVisibilityForm
 
 register = template.Library()
 
 
+@lru_cache(maxsize=4)
+def _moon_track(start, day_range):
+    """
+    Returns the offsets in days from ``start`` at which the Moon is sampled, the Moon's right ascension and declination
+    in radians at each offset, and its illuminated fraction. The track does not depend on the target, so it is only
+    calculated once for each ``start`` rather than on every page render.
+    """
+    times = Time(start, scale='utc') + np.arange(0, day_range, 0.2) * u.day
+    moon_pos = get_moon(times)
+    return times.mjd - times[0].mjd, moon_pos.ra.rad, moon_pos.dec.rad, moon_illumination(times)
+
+
 @register.inclusion_tag('tom_targets/partials/recent_targets.html', takes_context=True)
 def recent_targets(context, limit=10):
     """
@@ -129,23 +143,28 @@ def moon_distance(target, day_range=30):
     """
 
     day_range = 30
-    times = Time(
-        [str(datetime.utcnow() + timedelta(days=delta)) for delta in np.arange(0, day_range, 0.2)],
-        format='iso', scale='utc'
-    )
-
-    obj_pos = SkyCoord(target.ra, target.dec, unit=u.deg)
-    moon_pos = get_moon(times)
-
-    separations = moon_pos.separation(obj_pos).deg
-    phases = moon_illumination(times)
+    # The Moon is only sampled every 0.2 days, so renders within the same hour can share one track, and the
+    # separations for a given position can be reused until the hour is up. Only the plotted values are cached: the
+    # rendered div embeds all of plotly.js, which is several megabytes and too large for some cache backends
+    start = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    cache_key = 'moon_distance:{0:.4f}:{1:.4f}:{2}'.format(target.ra, target.dec, start.isoformat())
+    cached_values = cache.get(cache_key)
+    if cached_values is not None:
+        days, separations, phases = cached_values
+    else:
+        days, moon_ra, moon_dec, phases = _moon_track(start, day_range)
+        obj_ra, obj_dec = np.radians(target.ra), np.radians(target.dec)
+        separations = np.degrees(np.arccos(np.clip(
+            np.sin(moon_dec) * np.sin(obj_dec) + np.cos(moon_dec) * np.cos(obj_dec) * np.cos(moon_ra - obj_ra), -1, 1
+        )))
+        cache.set(cache_key, (days, separations, phases), 3600)
 
     distance_color = 'rgb(0, 0, 255)'
     phase_color = 'rgb(255, 0, 0)'
     plot_data = [
-        go.Scatter(x=times.mjd-times[0].mjd, y=separations, mode='lines', name='Moon distance (degrees)',
+        go.Scatter(x=days, y=separations, mode='lines', name='Moon distance (degrees)',
                    line=dict(color=distance_color)),
-        go.Scatter(x=times.mjd-times[0].mjd, y=phases, mode='lines', name='Moon phase', yaxis='y2',
+        go.Scatter(x=days, y=phases, mode='lines', name='Moon phase', yaxis='y2',
                    line=dict(color=phase_color))
     ]
     layout = go.Layout(
@@ -171,11 +190,14 @@ def target_distribution(targets):
     Displays a plot showing on a map the locations of all sidereal targets in the TOM.
     """
     locations = targets.filter(type=Target.SIDEREAL).values_list('ra', 'dec', 'name')
+    # Unzip the rows into columns in a single pass; missing coordinates become NaN, which plotly skips
+    rows = list(locations.iterator(chunk_size=2000))
+    ra, dec, names = zip(*rows) if rows else ((), (), ())
     data = [
         dict(
-            lon=[location[0] for location in locations],
-            lat=[location[1] for location in locations],
-            text=[location[2] for location in locations],
+            lon=np.array(ra, dtype=np.float64),
+            lat=np.array(dec, dtype=np.float64),
+            text=list(names),
             hoverinfo='lon+lat+text',
             mode='markers',
             type='scattergeo'
@@ -218,6 +240,16 @@ def deg_to_sexigesimal(value, fmt):
     """
     Displays a degree coordinate value in sexigesimal, given a format of hms or dms.
     """
+    # Coerce to float so that equal values of different numeric types share a cache entry
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        pass
+    return _deg_to_sexigesimal(value, fmt)
+
+
+@lru_cache(maxsize=16384)
+def _deg_to_sexigesimal(value, fmt):
     a = Angle(value, unit=u.degree)
     if fmt == 'hms':
         return '{0:02.0f}:{1:02.0f}:{2:05.3f}'.format(a.hms.h, a.hms.m, a.hms.s)
@@ -232,12 +264,14 @@ def deg_to_sexigesimal(value, fmt):
 @register.filter
 def target_extra_field(target, name):
     """
-    Returns a ``TargetExtra`` value of the given name, if one exists.
+    Returns a ``TargetExtra`` value of the given name, if one exists. All of the target's extras are read at once, using
+    ``prefetch_related('targetextra_set')`` where the view has done so, and reused for later calls on the same target.
     """
-    try:
-        return TargetExtra.objects.get(target=target, key=name).value
-    except TargetExtra.DoesNotExist:
-        return None
+    extras = getattr(target, '_target_extra_fields', None)
+    if extras is None:
+        extras = {target_extra.key: target_extra.value for target_extra in target.targetextra_set.all()}
+        target._target_extra_fields = extras
+    return extras.get(name)
 
 
 @register.inclusion_tag('tom_targets/partials/targetlist_select.html')
@@ -1,15 +1,28 @@
 import pytz
 from datetime import datetime
+from unittest import mock
+import numpy as np
+
+from astropy import units as u
+from astropy.coordinates import SkyCoord, get_moon
+from astropy.time import Time
 
 from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.messages import get_messages
 from django.contrib.messages.constants import SUCCESS, WARNING
 from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from .factories import SiderealTargetFactory, NonSiderealTargetFactory, TargetGroupingFactory, TargetNameFactory
+from tom_targets.forms import CoordinateField
+from tom_targets.templatetags import targets_extras
 from tom_targets.models import Target, TargetExtra, TargetList, TargetName
-from tom_targets.utils import import_targets
+from tom_targets.utils import export_targets, export_targets_iter, import_targets
 from guardian.shortcuts import assign_perm
 
 
@@ -395,6 +408,114 @@ class TestTargetCreate(TestCase):
         self.assertContains(second_response, 'Target name with this Alias for target already exists.')
 
 
+class TestCoordinateField(TestCase):
+    def test_to_python(self):
+        ra_field = CoordinateField(c_type='ra')
+        dec_field = CoordinateField(c_type='dec')
+        self.assertEqual(ra_field.to_python('83.633083'), 83.633083)
+        self.assertEqual(ra_field.to_python(83.633083), 83.633083)
+        self.assertAlmostEqual(ra_field.to_python('05:34:31.94'), 83.633083, places=5)
+        self.assertAlmostEqual(ra_field.to_python('05 34 31.94'), 83.633083, places=5)
+        self.assertAlmostEqual(dec_field.to_python('+22:00:52.2'), 22.0145, places=5)
+        self.assertAlmostEqual(dec_field.to_python('22d00m52.2s'), 22.0145, places=5)
+        with self.assertRaises(ValidationError):
+            dec_field.to_python('not a coordinate')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestMoonDistance(TestCase):
+    def setUp(self):
+        cache.clear()
+        targets_extras._moon_track.cache_clear()
+        self.addCleanup(targets_extras._moon_track.cache_clear)
+
+    @mock.patch('tom_targets.templatetags.targets_extras.offline.plot', return_value='<div></div>')
+    def test_moon_distance(self, mock_plot):
+        target = SiderealTargetFactory.create(ra=83.633083, dec=22.0145)
+        with mock.patch('tom_targets.templatetags.targets_extras.get_moon', wraps=get_moon) as mock_get_moon:
+            targets_extras.moon_distance(target)
+            targets_extras.moon_distance(target)
+        self.assertEqual(mock_get_moon.call_count, 1)
+
+        distance_trace = mock_plot.call_args[0][0].data[0]
+        start = Time(datetime.utcnow().replace(minute=0, second=0, microsecond=0), scale='utc')
+        times = start + distance_trace.x[[0, -1]] * u.day
+        expected = get_moon(times).separation(SkyCoord(target.ra, target.dec, unit=u.deg)).deg
+        self.assertAlmostEqual(distance_trace.y[0], expected[0], places=2)
+        self.assertAlmostEqual(distance_trace.y[-1], expected[1], places=2)
+
+    @mock.patch('tom_targets.templatetags.targets_extras.offline.plot', return_value='<div></div>')
+    def test_moon_distance_cached(self, mock_plot):
+        target = SiderealTargetFactory.create(ra=83.633083, dec=22.0145)
+        other_target = SiderealTargetFactory.create(ra=83.633083, dec=22.0145)
+        with mock.patch('tom_targets.templatetags.targets_extras._moon_track',
+                        wraps=targets_extras._moon_track) as mock_moon_track:
+            self.assertEqual(targets_extras.moon_distance(target), {'plot': '<div></div>'})
+            self.assertEqual(targets_extras.moon_distance(other_target), {'plot': '<div></div>'})
+            self.assertEqual(mock_moon_track.call_count, 1)
+
+            targets_extras.moon_distance(SiderealTargetFactory.create(ra=10, dec=10))
+            self.assertEqual(mock_moon_track.call_count, 2)
+
+        # The figure itself is rendered every time, only the plotted values are cached
+        self.assertEqual(mock_plot.call_count, 3)
+        first_plot, second_plot = mock_plot.call_args_list[0][0][0], mock_plot.call_args_list[1][0][0]
+        np.testing.assert_array_equal(first_plot.data[0].y, second_plot.data[0].y)
+
+
+class TestDegToSexigesimal(TestCase):
+    def test_deg_to_sexigesimal(self):
+        self.assertEqual(targets_extras.deg_to_sexigesimal(250.421, 'hms'), '16:41:41.040')
+        self.assertEqual(targets_extras.deg_to_sexigesimal(-36.459, 'dms'), '-36:27:32.400')
+        self.assertEqual(targets_extras.deg_to_sexigesimal('10.0', 'xyz'), 'fmt must be "hms" or "dms"')
+
+    def test_deg_to_sexigesimal_cached(self):
+        targets_extras._deg_to_sexigesimal.cache_clear()
+        self.addCleanup(targets_extras._deg_to_sexigesimal.cache_clear)
+        targets_extras.deg_to_sexigesimal(10, 'hms')
+        targets_extras.deg_to_sexigesimal('10.0', 'hms')
+        targets_extras.deg_to_sexigesimal(10.0, 'hms')
+        cache_info = targets_extras._deg_to_sexigesimal.cache_info()
+        self.assertEqual((cache_info.hits, cache_info.misses), (2, 1))
+
+
+class TestTargetExtraField(TestCase):
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        TargetExtra.objects.create(target=self.target, key='redshift', value='0.1')
+        TargetExtra.objects.create(target=self.target, key='discoverer', value='Someone')
+
+    def test_target_extra_field(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(targets_extras.target_extra_field(self.target, 'redshift'), '0.1')
+            self.assertEqual(targets_extras.target_extra_field(self.target, 'discoverer'), 'Someone')
+            self.assertIsNone(targets_extras.target_extra_field(self.target, 'missing'))
+
+    def test_target_extra_field_prefetched(self):
+        target = Target.objects.prefetch_related('targetextra_set').get(pk=self.target.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(targets_extras.target_extra_field(target, 'redshift'), '0.1')
+
+
+class TestTargetDistribution(TestCase):
+    @mock.patch('tom_targets.templatetags.targets_extras.go.Figure')
+    def test_target_distribution(self, mock_figure):
+        SiderealTargetFactory.create(name='m13', ra=250.421, dec=36.459)
+        NonSiderealTargetFactory.create(name='comet')
+        with mock.patch('tom_targets.templatetags.targets_extras.offline.plot'):
+            targets_extras.target_distribution(Target.objects.all())
+        locations = mock_figure.call_args[1]['data'][0]
+        self.assertEqual(list(locations['lon']), [250.421])
+        self.assertEqual(list(locations['lat']), [36.459])
+        self.assertEqual(locations['text'], ['m13'])
+
+    @mock.patch('tom_targets.templatetags.targets_extras.go.Figure')
+    def test_target_distribution_empty(self, mock_figure):
+        with mock.patch('tom_targets.templatetags.targets_extras.offline.plot'):
+            targets_extras.target_distribution(Target.objects.none())
+        self.assertEqual(len(mock_figure.call_args[1]['data'][0]['lon']), 0)
+
+
 class TestTargetImport(TestCase):
     def setUp(self):
         user = User.objects.create(username='testuser')
@@ -421,6 +542,49 @@ class TestTargetImport(TestCase):
         for target in result['targets']:
             self.assertTrue(TargetExtra.objects.filter(target=target, key='redshift', value='5').exists())
 
+    def test_import_empty_base_fields(self):
+        csv = [
+            'name,type,ra,dec,epoch,name1,discoverer',
+            'm13,SIDEREAL,250.421,36.459,,,',
+        ]
+        result = import_targets(csv)
+        self.assertEqual(result['errors'], [])
+        target = Target.objects.get(name='m13')
+        self.assertIsNone(target.epoch)
+        self.assertFalse(target.aliases.exists())
+        self.assertEqual(target.targetextra_set.get(key='discoverer').value, '')
+
+    def test_import_extra_typed_values(self):
+        csv = [
+            'name,type,ra,dec,redshift',
+            'm13,SIDEREAL,250.421,36.459,5.5',
+        ]
+        import_targets(csv)
+        extra = TargetExtra.objects.get(target__name='m13', key='redshift')
+        self.assertEqual(extra.float_value, 5.5)
+        self.assertTrue(extra.bool_value)
+
+    def test_import_bad_row_rolled_back(self):
+        csv = [
+            'name,type,ra,dec,name1',
+            'm13,SIDEREAL,250.421,36.459,Tom',
+            'm27,SIDEREAL,299.901,22.721,Tom',
+            'm31,SIDEREAL,10.684,41.269,Joe'
+        ]
+        result = import_targets(csv)
+        self.assertEqual([target.name for target in result['targets']], ['m13', 'm31'])
+        self.assertEqual(len(result['errors']), 1)
+        self.assertTrue(result['errors'][0].startswith('Error on line 3'))
+        self.assertFalse(Target.objects.filter(name='m27').exists())
+
+    def test_import_view(self):
+        csv_content = 'name,type,ra,dec\r\nm13,SIDEREAL,250.421,36.459\r\nM\u00f6bius,SIDEREAL,1,2\r\n'
+        csv_file = SimpleUploadedFile('targets.csv', csv_content.encode('utf-8'))
+        response = self.client.post(reverse('tom_targets:import'), {'target_csv': csv_file})
+        self.assertRedirects(response, reverse('tom_targets:list'))
+        self.assertTrue(Target.objects.filter(name='m13').exists())
+        self.assertTrue(Target.objects.filter(name='M\u00f6bius').exists())
+
     def test_import_csv_with_multiple_names(self):
         csv = [
             'name,type,ra,dec,name1,name2',
@@ -480,6 +644,33 @@ class TestTargetExport(TestCase):
         self.assertIn('M42', content)
         self.assertNotIn('M52', content)
 
+    def test_export_targets_iter(self):
+        lines = list(export_targets_iter(Target.objects.filter(name='M42').values()))
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('name,'))
+        self.assertTrue(lines[1].startswith('M42,'))
+        self.assertEqual(''.join(lines), export_targets(Target.objects.filter(name='M42').values()).getvalue())
+
+    def test_export_targets_extras_and_aliases(self):
+        TargetExtra.objects.create(target=self.st, key='redshift', value='0.1')
+        TargetNameFactory.create(name='Messier 42', target=self.st)
+        TargetNameFactory.create(name='Orion Nebula', target=self.st)
+        with CaptureQueriesContext(connection) as two_target_queries:
+            content = export_targets(Target.objects.all().values()).getvalue()
+        rows = content.splitlines()
+        self.assertIn('redshift', rows[0])
+        self.assertIn('name3', rows[0])
+        self.assertIn('0.1', content)
+        self.assertIn('Orion Nebula', content)
+
+        for i in range(3):
+            target = SiderealTargetFactory.create(name=f'target{i}')
+            TargetExtra.objects.create(target=target, key='redshift', value='0.2')
+            TargetNameFactory.create(name=f'alias{i}', target=target)
+        with CaptureQueriesContext(connection) as many_target_queries:
+            export_targets(Target.objects.all().values())
+        self.assertEqual(len(two_target_queries), len(many_target_queries))
+
 
 class TestTargetSearch(TestCase):
     def setUp(self):
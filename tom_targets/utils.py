@@ -1,60 +1,83 @@
-from django.db.models import Count
+from collections import defaultdict
 
 import csv
+from django.db import transaction
+
 from .models import Target, TargetExtra, TargetName
 from io import StringIO
 
 
-# NOTE: This saves locally. To avoid this, create file buffer.
+class _Echo:
+    """
+    File-like object whose ``write`` returns what it was given, so that a ``csv.writer`` produces rows as strings.
+    """
+    def write(self, value):
+        return value
+
+
 # referenced https://www.codingforentrepreneurs.com/blog/django-queryset-to-csv-files-datasets/
-def export_targets(qs):
+def export_targets_iter(qs):
     """
-    Exports all the specified targets into a csv file in folder csvTargetFiles
-    NOTE: This saves locally. To avoid this, create file buffer.
+    Exports all the specified targets as csv, one line at a time, so that the export can be streamed without holding
+    the whole file in memory.
 
     :param qs: List of targets to export
     :type qs: QuerySet
 
-    :returns: String buffer of exported targets
-    :rtype: StringIO
+    :returns: Generator of csv lines, starting with the header
+    :rtype: generator
     """
     qs_pk = [data['id'] for data in qs]
     data_list = list(qs)
-    target_fields = [field.name for field in Target._meta.get_fields()]
-    target_extra_fields = list({field.key for field in TargetExtra.objects.filter(target__in=qs_pk)})
-    # Gets the count of the target names for the target with the most aliases in the database
+    excluded_fields = ['id', 'targetlist', 'dataproduct', 'observationrecord', 'reduceddatum', 'aliases', 'targetextra']
+    target_fields = [field.name for field in Target._meta.get_fields() if field.name not in excluded_fields]
+    # Fetch the extras and aliases of every exported target up front, rather than querying for them target by target
+    extras_by_target = defaultdict(list)
+    for target_id, key, value in TargetExtra.objects.filter(target__in=qs_pk).values_list('target_id', 'key', 'value'):
+        extras_by_target[target_id].append((key, value))
+    names_by_target = defaultdict(list)
+    for target_id, name in TargetName.objects.filter(target__in=qs_pk).order_by('pk').values_list('target_id', 'name'):
+        names_by_target[target_id].append(name)
+    target_extra_fields = list({key for extras in extras_by_target.values() for key, _ in extras})
+    # Gets the count of the target names for the target with the most aliases
     # This is to construct enough row headers of format "name2, name3, name4, etc" for exporting aliases
     # The alias headers are then added to the set of fields for export
-    aliases = TargetName.objects.filter(target__in=qs_pk).values('target_id').annotate(count=Count('target_id'))
-    max_alias_count = 0
-    if aliases:
-        max_alias_count = max([alias['count'] for alias in aliases])
-    all_fields = target_fields + target_extra_fields + [f'name{index+1}' for index in range(1, max_alias_count+1)]
-    for key in ['id', 'targetlist', 'dataproduct', 'observationrecord', 'reduceddatum', 'aliases', 'targetextra']:
-        all_fields.remove(key)
+    max_alias_count = max([len(names) for names in names_by_target.values()], default=0)
+    alias_fields = [f'name{index+1}' for index in range(1, max_alias_count+1)]
+    all_fields = target_fields + target_extra_fields + alias_fields
 
-    file_buffer = StringIO()
-    writer = csv.DictWriter(file_buffer, fieldnames=all_fields)
-    writer.writeheader()
+    writer = csv.DictWriter(_Echo(), fieldnames=all_fields)
+    # DictWriter.writeheader only returns the written line from Python 3.8 onwards
+    yield writer.writerow(dict(zip(all_fields, all_fields)))
     for target_data in data_list:
-        extras = list(TargetExtra.objects.filter(target_id=target_data['id']))
-        names = list(TargetName.objects.filter(target_id=target_data['id']))
-        for e in extras:
-            target_data[e.key] = e.value
-        name_index = 2
-        for name in names:
-            target_data[f'name{str(name_index)}'] = name.name
-            name_index += 1
-        del target_data['id']  # do not export 'id'
-        writer.writerow(target_data)
+        # Build each row from the export fields only, so 'id' is never included
+        row = {field: target_data.get(field) for field in target_fields}
+        row.update(extras_by_target[target_data['id']])
+        row.update(zip(alias_fields, names_by_target[target_data['id']]))
+        yield writer.writerow(row)
+
+
+def export_targets(qs):
+    """
+    Exports all the specified targets into a csv file buffer. See ``export_targets_iter`` to stream the export instead.
+
+    :param qs: List of targets to export
+    :type qs: QuerySet
+
+    :returns: String buffer of exported targets
+    :rtype: StringIO
+    """
+    file_buffer = StringIO()
+    file_buffer.writelines(export_targets_iter(qs))
     return file_buffer
 
 
+@transaction.atomic
 def import_targets(targets):
     """
     Imports a set of targets into the TOM and saves them to the database.
 
-    :param targets: String buffer of targets
+    :param targets: String buffer, or any other iterable of lines, of targets
     :type targets: StringIO
 
     :returns: dictionary of successfully imported targets, as well errors
@@ -64,31 +87,27 @@ def import_targets(targets):
     targetreader = csv.DictReader(targets, dialect=csv.excel)
     targets = []
     errors = []
-    base_target_fields = [field.name for field in Target._meta.get_fields()]
+    base_target_fields = frozenset(field.name for field in Target._meta.get_fields())
+    # Sort the columns once, rather than for every row. All fields starting with 'name' (e.g. name2, name3) that
+    # aren't literally 'name' will be added as TargetNames
+    fieldnames = targetreader.fieldnames or []
+    name_columns = [k for k in fieldnames if k != 'name' and k.startswith('name')]
+    base_columns = [k for k in fieldnames if k in base_target_fields and k not in name_columns]
+    extra_columns = [k for k in fieldnames if k not in base_target_fields and k not in name_columns]
     for index, row in enumerate(targetreader):
         # filter out empty values in base fields, otherwise converting empty string to float will throw error
-        row = {k: v for (k, v) in row.items() if not (k in base_target_fields and not v)}
-        target_extra_fields = []
-        target_names = []
-        target_fields = {}
-        for k in row:
-            # All fields starting with 'name' (e.g. name2, name3) that aren't literally 'name' will be added as
-            # TargetNames
-            if k != 'name' and k.startswith('name'):
-                target_names.append(row[k])
-            elif k not in base_target_fields:
-                target_extra_fields.append((k, row[k]))
-            else:
-                target_fields[k] = row[k]
-        for extra in target_extra_fields:
-            row.pop(extra[0])
+        target_fields = {k: row[k] for k in base_columns if row[k]}
+        target_extra_fields = [(k, row[k]) for k in extra_columns]
+        target_names = [row[k] for k in name_columns]
         try:
-            target = Target.objects.create(**target_fields)
-            for extra in target_extra_fields:
-                TargetExtra.objects.create(target=target, key=extra[0], value=extra[1])
-            for name in target_names:
-                if name:
-                    TargetName.objects.create(target=target, name=name)
+            # Each row gets its own savepoint, so that a bad row is rolled back entirely without affecting the rest
+            with transaction.atomic():
+                target = Target.objects.create(**target_fields)
+                extras = [TargetExtra(target=target, key=key, value=value) for key, value in target_extra_fields]
+                for extra in extras:
+                    extra.set_typed_values()
+                TargetExtra.objects.bulk_create(extras)
+                TargetName.objects.bulk_create([TargetName(target=target, name=name) for name in target_names if name])
             targets.append(target)
         except Exception as e:
             error = 'Error on line {0}: {1}'.format(index + 2, str(e))
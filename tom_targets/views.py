@@ -1,3 +1,4 @@
+import codecs
 import logging
 
 from datetime import datetime
@@ -34,7 +35,7 @@ from tom_targets.models import Target, TargetList
 from tom_targets.forms import (
     SiderealTargetCreateForm, NonSiderealTargetCreateForm, TargetExtraFormset, TargetNamesFormset
 )
-from tom_targets.utils import import_targets, export_targets
+from tom_targets.utils import import_targets, export_targets_iter
 from tom_targets.filters import TargetFilter
 from tom_targets.groups import add_all_to_grouping, add_selected_to_grouping
 from tom_targets.groups import remove_all_from_grouping, remove_selected_from_grouping
@@ -53,6 +54,16 @@ class TargetListView(PermissionListMixin, FilterView):
     filterset_class = TargetFilter
     permission_required = 'tom_targets.view_target'
 
+    def get_queryset(self, *args, **kwargs):
+        """
+        Returns the targets the user is authorized to view, with their extras prefetched for the ``target_extra_field``
+        template filter.
+
+        :returns: Set of targets
+        :rtype: QuerySet
+        """
+        return super().get_queryset(*args, **kwargs).prefetch_related('targetextra_set')
+
     def get_context_data(self, *args, **kwargs):
         """
         Adds the number of targets visible, the available ``TargetList`` objects if the user is authenticated, and
@@ -374,13 +385,14 @@ class TargetImportView(LoginRequiredMixin, TemplateView):
 
     def post(self, request):
         """
-        Handles the POST requests to this view. Creates a StringIO object and passes it to ``import_targets``.
+        Handles the POST requests to this view. Decodes the uploaded file one line at a time and passes the lines to
+        ``import_targets``, so the whole file is never held in memory as a string.
 
         :param request: the request object passed to this view
         :type request: HTTPRequest
         """
         csv_file = request.FILES['target_csv']
-        csv_stream = StringIO(csv_file.read().decode('utf-8'), newline=None)
+        csv_stream = codecs.iterdecode(csv_file, 'utf-8')
         result = import_targets(csv_stream)
         messages.success(
             request,
@@ -406,9 +418,7 @@ class TargetExportView(TargetListView):
         :rtype: StreamingHttpResponse
         """
         qs = context['filter'].qs.values()
-        file_buffer = export_targets(qs)
-        file_buffer.seek(0)  # goto the beginning of the buffer
-        response = StreamingHttpResponse(file_buffer, content_type="text/csv")
+        response = StreamingHttpResponse(export_targets_iter(qs), content_type="text/csv")
         filename = "targets-{}.csv".format(slugify(datetime.utcnow()))
         response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
         return response